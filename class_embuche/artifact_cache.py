@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import fcntl
+import hashlib
+import tempfile
+
+# Default location and size of the cache
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'embuche')
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+def compute_key(parts):
+    # Hash a list of strings or bytes into the key of an entry
+    digest = hashlib.sha256()
+
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # Hash the size of each part to avoid collisions between concatenations
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+
+    return digest.hexdigest()
+
+def hash_file(path):
+    # Return the sha256 of a file content
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as target:
+        for chunk in iter(lambda: target.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+class artifact_cache():
+    # Content addressed cache of the final binaries, an entry is the binary produced by a build and its name is the key of the build
+    # The least recently used entries are removed when the cache is bigger than max_size (bytes)
+    def __init__(self, cache_directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.__set_cache_directory(cache_directory if cache_directory is not None else DEFAULT_CACHE_DIRECTORY)
+        self.__max_size = max_size
+
+    def __set_cache_directory(self, cache_directory):
+        # Create cache directory and the directory where entries are stored
+        self.__cache_directory = cache_directory
+        os.makedirs(self.get_artifacts_directory(), exist_ok=True)
+
+    def get_cache_directory(self):
+        # Return path to the cache directory
+        return self.__cache_directory
+
+    def get_artifacts_directory(self):
+        # Return path to the directory of the entries
+        return os.path.join(self.__cache_directory, 'artifacts')
+
+    def get_max_size(self):
+        # Return the maximum size of the cache in bytes
+        return self.__max_size
+
+    def get(self, key, destination):
+        # Copy the entry to destination, return False if there's no entry for this key
+        entry = os.path.join(self.get_artifacts_directory(), key)
+
+        try:
+            shutil.copy2(entry, destination)
+            # Mark the entry as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            self.__update_stats('misses')
+            return False
+
+        self.__update_stats('hits')
+        return True
+
+    def put(self, key, source):
+        # Store source as the entry of key, the copy is renamed once complete so a concurrent get never sees half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.get_artifacts_directory(), prefix='.tmp_')
+        os.close(descriptor)
+        shutil.copy2(source, temporary)
+        os.replace(temporary, os.path.join(self.get_artifacts_directory(), key))
+
+        self.__evict()
+
+    def __get_entries(self):
+        # Return the entries (path, size, last use) sorted from the least recently used
+        entries = []
+
+        for name in os.listdir(self.get_artifacts_directory()):
+            path = os.path.join(self.get_artifacts_directory(), name)
+            if name.startswith('.tmp_'):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def __evict(self):
+        # Remove the least recently used entries until the cache fits in max_size
+        entries = self.__get_entries()
+        size = sum(entry[1] for entry in entries)
+        evictions = 0
+
+        while size > self.get_max_size() and len(entries) > 0:
+            path, entry_size, last_use = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            evictions += 1
+
+        if evictions:
+            self.__update_stats('evictions', evictions)
+
+    def __update_stats(self, counter, value=1):
+        # Statistics are shared by every process using the cache, they're updated under a lock
+        with open(os.path.join(self.get_cache_directory(), 'stats.json'), 'a+') as target:
+            fcntl.flock(target, fcntl.LOCK_EX)
+            target.seek(0)
+            try:
+                stats = json.loads(target.read())
+            except ValueError:
+                stats = {}
+
+            stats[counter] = stats.get(counter, 0) + value
+
+            target.seek(0)
+            target.truncate()
+            target.write(json.dumps(stats))
+
+    def get_stats(self):
+        # Return the hits, misses and evictions counters with the current number of entries and size of the cache
+        try:
+            with open(os.path.join(self.get_cache_directory(), 'stats.json'), 'r') as target:
+                stats = json.loads(target.read())
+        except (FileNotFoundError, ValueError):
+            stats = {}
+
+        entries = self.__get_entries()
+
+        return {
+            'hits': stats.get('hits', 0),
+            'misses': stats.get('misses', 0),
+            'evictions': stats.get('evictions', 0),
+            'entries': len(entries),
+            'size': sum(entry[1] for entry in entries),
+            'max_size': self.get_max_size()
+        }
+
+    def clear(self):
+        # Remove every entry and reset the statistics
+        shutil.rmtree(self.get_cache_directory())
+        os.makedirs(self.get_artifacts_directory(), exist_ok=True)
@@ -29,12 +29,12 @@ char* calc_addr(char* p_addr)
 
 void __attribute__((optimize("O1"))) embuche_checker(int dumpable, int ptrace, int file_descriptor, int pid, int ppid, int ld_preload)
 {
-  /* Overlapping Instructions */
+  /* Overlapping Instructions (local label, the code can be duplicated by the compiler or merged with other files by LTO) */
   asm volatile(
-  "mov_ins:\n"
+  "1:\n"
   "mov $2283, %%rax\n"
   "xor %%rax, %%rax\n"
-  "jz mov_ins+3\n"
+  "jz 1b+3\n"
   ".byte 0xe8\n"
   : :
   : "%rax");
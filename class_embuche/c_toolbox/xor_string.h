@@ -74,12 +74,12 @@
 char* __attribute__((optimize("O1"))) undo_xor_string(char* string, int length, char* key, int key_length)
 {
 
-    /* Overlapping Instructions */
+    /* Overlapping Instructions (local label, the code can be duplicated by the compiler or merged with other files by LTO) */
     asm volatile(
-    "mov_ins:\n"
+    "1:\n"
     "mov $2283, %%rax\n"
     "xor %%rax, %%rax\n"
-    "jz mov_ins+3\n"
+    "jz 1b+3\n"
     ".byte 0xe8\n"
     : :
     : "%rax");
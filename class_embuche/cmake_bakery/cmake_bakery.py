@@ -1,8 +1,70 @@
 import os
 from jinja2 import Environment, FileSystemLoader
 
+# The Jinja environment is shared by every project of the process, the templates are parsed once (batch mode, daemon)
+TEMPLATE_ENVIRONMENT = None
+
+def get_template_environment():
+    # Return the Jinja environment of the templates, it's created the first time it's asked
+    global TEMPLATE_ENVIRONMENT
+
+    if TEMPLATE_ENVIRONMENT is None:
+        TEMPLATE_ENVIRONMENT = Environment(loader=FileSystemLoader(os.path.dirname(os.path.realpath(__file__)) + '/templates'))
+
+    return TEMPLATE_ENVIRONMENT
+
+# Flags of the link time optimization (compilation and link) and of the two steps of the profile guided optimization ({} is the directory of the profile)
+LTO_C_FLAGS = '-flto -ffunction-sections -fdata-sections'
+LTO_LINKER_FLAGS = '-flto -Wl,--gc-sections'
+PGO_C_FLAGS = {
+    'generate': '-fprofile-generate -fprofile-dir={}',
+    'use': '-fprofile-use -fprofile-dir={} -fprofile-correction -Wno-missing-profile'
+}
+
+def get_compiler(compilation_options):
+    # Return the C compiler of the project: musl-gcc for a static binary, CC or cc otherwise (like CMake)
+    return 'musl-gcc' if compilation_options['static']['value'] is True else os.environ.get('CC', 'cc')
+
+def get_c_flags(compilation_options):
+    # Return the flags given to the compiler for each source and to the link (CMAKE_C_FLAGS), without LTO and PGO
+    flags = '-Wall -Wextra -Wshadow -g0 '
+
+    for option, flag in [('strip', '-s'), ('symbols_hidden', '-fvisibility=hidden'), ('optimize', '-O3'), ('unroll_loops', '-funroll-all-loops'), ('static', '-static')]:
+        if compilation_options[option]['value']:
+            flags += flag + ' '
+
+    if 'custom' in compilation_options:
+        for flag in compilation_options['custom']['value']:
+            flags += '-{} '.format(flag)
+
+    return flags + '-std=gnu11'
+
+def get_file_format_passes(options):
+    # Create the ordered list of passes given to elf_passes.py, the order matters:
+    # the section header table must be removed before creating the fake sections and the endianness must be changed last
+    file_format = options['file_format']
+    passes = []
+
+    if file_format['remove_section_header']['value']:
+        passes.append('remove_section_header')
+
+        if file_format['flip_sections_flags']['value'] and file_format['hide_entry_point']['value']:
+            passes.append('flip_sections_flags_and_hide_entry_point')
+        elif file_format['flip_sections_flags']['value']:
+            passes.append('flip_sections_flags')
+        elif file_format['hide_entry_point']['value']:
+            passes.append('hide_entry_point')
+
+    elif file_format['mixing_symbols']['value']:
+        passes.append('mixing_symbols')
+
+    if file_format['endianness']['value']:
+        passes.append('endianness')
+
+    return passes
+
 class cmake_bakery():
-    def __init__(self, project_path, project_name, options, template_name):
+    def __init__(self, project_path, project_name, options, template_name, toolbox_objects=None):
         # Set the name of the template to use
         self.__set_template_name(template_name)
         # Create the Jinja environment
@@ -10,14 +72,14 @@ class cmake_bakery():
         # Create path to the final CMake
         self.__set_cmake_path(project_path)
         # Create the options to fill the CMake template
-        self.__set_template_dict(project_path, project_name, options)
+        self.__set_template_dict(project_path, project_name, options, toolbox_objects)
         # Fill the Cmake with the options
         self.__set_render_template()
 
     def __set_template_env(self):
         # Create the template environment
-        self.__file_loader = FileSystemLoader(os.path.dirname(os.path.realpath(__file__)) + '/templates')
-        self.__file_loader_env = Environment(loader=self.__file_loader)
+        self.__file_loader_env = get_template_environment()
+        self.__file_loader = self.__file_loader_env.loader
         self.__initial_cmake_template = self.__file_loader_env.get_template(self.get_template_name())
 
     def get_template_env(self):
@@ -40,7 +102,7 @@ class cmake_bakery():
         # Return the path to the CMake (in the project)
         return self.__cmake_path
 
-    def __set_template_dict(self, project_path, project_name, conf):
+    def __set_template_dict(self, project_path, project_name, conf, toolbox_objects=None):
         # Create dict with the path to;
         # - the main source code
         # - path to the project directory
@@ -48,15 +110,29 @@ class cmake_bakery():
         # - path to packer scripts
         # - Dictionnary of options to use
         # - Filename to compile as well
+        # - Ordered list of file format hacks to apply after the link
+        # - Flags of the compiler (shared with the direct backend)
+        # - Objects of the C toolbox compiled once for the flags of the project (source: object)
         self.__template_values = {
             'binary_path': project_path,
             'project_name': project_name,
             'hellf_script_path': os.path.dirname(os.path.realpath(__file__)) + '/hellf_scripts',
+            'daemon_client_path': os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/daemon_client.py',
             'packer_path': os.path.dirname(os.path.realpath(__file__)) + '/packer',
             'options': conf['options'],
-            'files': conf['files']
+            'files': conf['files'],
+            'file_format_passes': self.__get_file_format_passes(conf['options']),
+            'c_flags': get_c_flags(conf['options']['compilation_options']),
+            'lto_c_flags': LTO_C_FLAGS,
+            'lto_linker_flags': LTO_LINKER_FLAGS,
+            'pgo_c_flags': {step: flags.format('${EMBUCHE_PGO_DIR}') for step, flags in PGO_C_FLAGS.items()},
+            'toolbox_objects': toolbox_objects if toolbox_objects is not None else {}
         }
 
+    def __get_file_format_passes(self, options):
+        # Create the ordered list of passes given to elf_passes.py
+        return get_file_format_passes(options)
+
     def get_template_dict(self):
         # Return the dictionnary with all the options to use for create the CMake
         return self.__template_values
@@ -79,5 +155,13 @@ class cmake_bakery():
 
     def create_cmakelist_file(self):
         # Create the CMake file with the options of Embuche and write it in the project directory
+        # The file is only written if its content changed (CMake configures again when the file is modified), return True if written
+        if os.path.exists(self.get_cmake_path()):
+            with open(self.get_cmake_path(), 'r') as target:
+                if target.read() == self.get_render_template():
+                    return False
+
         with open(self.get_cmake_path(), 'w') as target:
             target.write(self.get_render_template())
+
+        return True
@@ -0,0 +1,233 @@
+# coding: utf-8
+import mmap
+from collections import OrderedDict
+from struct import Struct, pack_into
+
+# Layout of Elf64_Ehdr, field: (offset in the header, struct format)
+ELF64_EHDR = OrderedDict([
+    ('e_ident', (0, '16s')),
+    ('e_type', (16, '<H')),
+    ('e_machine', (18, '<H')),
+    ('e_version', (20, '<I')),
+    ('e_entry', (24, '<Q')),
+    ('e_phoff', (32, '<Q')),
+    ('e_shoff', (40, '<Q')),
+    ('e_flags', (48, '<I')),
+    ('e_ehsize', (52, '<H')),
+    ('e_phentsize', (54, '<H')),
+    ('e_phnum', (56, '<H')),
+    ('e_shentsize', (58, '<H')),
+    ('e_shnum', (60, '<H')),
+    ('e_shstrndx', (62, '<H'))
+])
+
+# Layout of Elf64_Phdr, field: (offset in the header, struct format)
+ELF64_PHDR = OrderedDict([
+    ('p_type', (0, '<I')),
+    ('p_flags', (4, '<I')),
+    ('p_offset', (8, '<Q')),
+    ('p_vaddr', (16, '<Q')),
+    ('p_paddr', (24, '<Q')),
+    ('p_filesz', (32, '<Q')),
+    ('p_memsz', (40, '<Q')),
+    ('p_align', (48, '<Q'))
+])
+
+# Layout of Elf64_Shdr, field: (offset in the header, struct format)
+ELF64_SHDR = OrderedDict([
+    ('sh_name', (0, '<I')),
+    ('sh_type', (4, '<I')),
+    ('sh_flags', (8, '<Q')),
+    ('sh_addr', (16, '<Q')),
+    ('sh_offset', (24, '<Q')),
+    ('sh_size', (32, '<Q')),
+    ('sh_link', (40, '<I')),
+    ('sh_info', (44, '<I')),
+    ('sh_addralign', (48, '<Q')),
+    ('sh_entsize', (56, '<Q'))
+])
+
+ELF64_EHDR_SIZE = 0x40
+ELF64_PHDR_SIZE = 0x38
+ELF64_SHDR_SIZE = 0x40
+
+PT_LOAD = 0x1
+SHT_NOBITS = 0x8
+
+# Whole headers unpacked at once, the fields are in the order of the layouts
+ELF64_EHDR_STRUCT = Struct('<16sHHIQQQIHHHHHH')
+ELF64_PHDR_STRUCT = Struct('<IIQQQQQQ')
+ELF64_SHDR_STRUCT = Struct('<IIQQQQIIQQ')
+
+# Pack a Elf64_Shdr from a dictionnary of fields, missing fields are set to 0
+def pack_shdr(**fields):
+    shdr = bytearray(ELF64_SHDR_SIZE)
+
+    for field, (offset, fmt) in ELF64_SHDR.items():
+        pack_into(fmt, shdr, offset, fields.get(field, 0))
+
+    return bytes(shdr)
+
+class elf_model():
+    # ELF64 read through a mapping of the file (read-only unless writable is True)
+    # Only the ELF header is parsed when the file is opened, the program headers, the section headers and the names of the sections
+    # are parsed the first time they're used and kept until they're modified, the content of a section is only read when it's asked
+    def __init__(self, binary, writable=False):
+        self.__binary = binary
+        self.__writable = writable
+        self.__file = open(binary, 'r+b' if writable else 'rb')
+        self.__mapping = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        self.__ehdr = self.__parse_ehdr()
+        self.__phdrs = None
+        self.__shdrs = None
+        self.__section_indexes = None
+
+    def get_binary(self):
+        # Return the path of the binary
+        return self.__binary
+
+    def size(self):
+        # Return the current size of the file
+        return len(self.__mapping)
+
+    def read(self, offset, size):
+        # Return size bytes of the file, only this range is copied
+        return self.__mapping[offset:offset + size]
+
+    def write(self, offset, data):
+        # Write raw bytes in place, the parsed headers in this range are parsed again when they're used
+        self.__mapping[offset:offset + len(data)] = data
+
+        if offset < ELF64_EHDR_SIZE:
+            self.__ehdr = self.__parse_ehdr()
+        self.__invalidate()
+
+    def append(self, data):
+        # Grow the file and write data at the end, return the offset where data has been written
+        offset = len(self.__mapping)
+        self.__mapping.resize(offset + len(data))
+        self.__mapping[offset:] = data
+
+        # The appended data can be part of a header table declared at the end of the file
+        self.__invalidate()
+
+        return offset
+
+    def append_shdr(self, **fields):
+        # Append a section header at the end of the file (missing fields are set to 0), return its offset
+        return self.append(pack_shdr(**fields))
+
+    def __invalidate(self):
+        self.__phdrs = None
+        self.__shdrs = None
+        self.__section_indexes = None
+
+    def __parse_ehdr(self):
+        return OrderedDict(zip(ELF64_EHDR.keys(), ELF64_EHDR_STRUCT.unpack_from(self.__mapping, 0)))
+
+    def __parse_table(self, layout, structure, offset, count):
+        # Parse a table of headers with a single unpack for each entry
+        table = self.__mapping[offset:offset + count * structure.size]
+        return [OrderedDict(zip(layout.keys(), fields)) for fields in structure.iter_unpack(table)]
+
+    def get_phdrs(self):
+        # Return the program headers (list of dictionnaries), parsed at the first call
+        if self.__phdrs is None:
+            self.__phdrs = self.__parse_table(ELF64_PHDR, ELF64_PHDR_STRUCT, self.get_ehdr('e_phoff'), self.get_ehdr('e_phnum'))
+
+        return self.__phdrs
+
+    def get_shdrs(self):
+        # Return the section headers (list of dictionnaries), parsed at the first call
+        if self.__shdrs is None:
+            if self.get_ehdr('e_shoff') == 0:
+                self.__shdrs = []
+            else:
+                self.__shdrs = self.__parse_table(ELF64_SHDR, ELF64_SHDR_STRUCT, self.get_ehdr('e_shoff'), self.get_ehdr('e_shnum'))
+
+        return self.__shdrs
+
+    def get_ehdr(self, field):
+        # Return a field of the ELF header
+        return self.__ehdr[field]
+
+    def set_ehdr(self, field, value):
+        # Set a field of the ELF header, the tables are parsed again if their position changed
+        offset, fmt = ELF64_EHDR[field]
+        pack_into(fmt, self.__mapping, offset, value)
+        self.__ehdr[field] = value
+
+        if field in ['e_phoff', 'e_phnum']:
+            self.__phdrs = None
+        elif field in ['e_shoff', 'e_shnum', 'e_shstrndx']:
+            self.__shdrs = None
+            self.__section_indexes = None
+
+    def get_phdr(self, index, field):
+        # Return a field of the index-th program header
+        return self.get_phdrs()[index][field]
+
+    def set_phdr(self, index, field, value):
+        # Set a field of the index-th program header
+        offset, fmt = ELF64_PHDR[field]
+        pack_into(fmt, self.__mapping, self.get_ehdr('e_phoff') + index * ELF64_PHDR_SIZE + offset, value)
+
+        if self.__phdrs is not None:
+            self.__phdrs[index][field] = value
+
+    def get_shdr(self, index, field):
+        # Return a field of the index-th section header
+        return self.get_shdrs()[index][field]
+
+    def set_shdr(self, index, field, value):
+        # Set a field of the index-th section header
+        offset, fmt = ELF64_SHDR[field]
+        pack_into(fmt, self.__mapping, self.get_ehdr('e_shoff') + index * ELF64_SHDR_SIZE + offset, value)
+
+        if self.__shdrs is not None:
+            self.__shdrs[index][field] = value
+        if field == 'sh_name' or index == self.get_ehdr('e_shstrndx'):
+            self.__section_indexes = None
+
+    def get_load_segments(self):
+        # Iterate over the PT_LOAD segments, (index, program header)
+        for index, phdr in enumerate(self.get_phdrs()):
+            if phdr['p_type'] == PT_LOAD:
+                yield index, phdr
+
+    def get_section_name(self, index):
+        # Read the name of a section in the section header string table
+        strtab = self.get_shdr(self.get_ehdr('e_shstrndx'), 'sh_offset')
+        start = strtab + self.get_shdr(index, 'sh_name')
+        end = self.__mapping.find(b"\x00", start)
+
+        return self.__mapping[start:end].decode('utf-8')
+
+    def find_section(self, name):
+        # Return the index of the section named name, None if it doesn't exist (the names are read once)
+        if self.__section_indexes is None:
+            self.__section_indexes = {}
+            for index in reversed(range(len(self.get_shdrs()))):
+                self.__section_indexes[self.get_section_name(index)] = index
+
+        return self.__section_indexes.get(name)
+
+    def get_section_by_name(self, name):
+        # Return the section header of the section named name, None if it doesn't exist
+        index = self.find_section(name)
+        return self.get_shdrs()[index] if index is not None else None
+
+    def get_section_data(self, name):
+        # Return the content of the section named name, None if it doesn't exist or has no content on disk
+        shdr = self.get_section_by_name(name)
+        if shdr is None or shdr['sh_type'] == SHT_NOBITS:
+            return None
+
+        return self.read(shdr['sh_offset'], shdr['sh_size'])
+
+    def close(self):
+        # Flush the modifications to the disk (if any) and release the mapping
+        if self.__writable:
+            self.__mapping.flush()
+        self.__mapping.close()
+        self.__file.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/python3.8
+# coding: utf-8
+import argparse
+import os
+import random
+import sys
+from collections import OrderedDict
+from huepy import *
+from elf_patcher import elf_patcher
+
+from remove_sections import remove_section_header
+from endianness_changer import change_endianness
+from flip_sections_flags import flip_sections_flags, check_no_section_header
+from hide_entry_point import hide_entry_point
+from flip_sections_flags_and_hide_entry_point import flip_sections_flags_and_hide_entry_point
+from mixing_symbols_table import append_dynsym, check_section_header
+
+# The events of the passes are appended to the trace of Embuche with its tracer (standard library only)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+from class_embuche import tracer
+
+# Every pass available, with the check the stand-alone script does before modifying the binary (None if there's no check)
+PASSES = OrderedDict([
+    ('remove_section_header', (None, remove_section_header)),
+    ('flip_sections_flags', (check_no_section_header, flip_sections_flags)),
+    ('hide_entry_point', (check_no_section_header, hide_entry_point)),
+    ('flip_sections_flags_and_hide_entry_point', (check_no_section_header, flip_sections_flags_and_hide_entry_point)),
+    ('mixing_symbols', (check_section_header, append_dynsym)),
+    ('endianness', (None, change_endianness))
+])
+
+# Append the timing of a pass to the trace of Embuche if one is recorded (measure started with tracer.start_measure)
+def trace_pass(name, binary, measure):
+    tracer.record(name, 'hellf', measure, process='elf_passes.py', binary=os.path.basename(binary))
+
+# Apply the passes in the given order, each pass patches the mapped binary in place
+def apply_passes(elf, passes):
+    for name in passes:
+        check, transformation = PASSES[name]
+        measure = tracer.start_measure()
+
+        # Skip the pass if the binary isn't in the state required by it
+        if check is not None and not check(elf):
+            print(bad("{} skipped".format(name)))
+            continue
+
+        elf = transformation(elf)
+        trace_pass(name, elf.get_binary(), measure)
+
+    return elf
+
+# Apply the passes given in the arguments (command line if None), it's also called by the daemon of Embuche
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Apply several file format hacks with a single mapping of the binary')
+    parser.add_argument('binary', type=str, help='Binary to modify')
+    parser.add_argument('passes', type=str, nargs='+', choices=PASSES.keys(), help='Passes to apply, in order')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the random parts of the passes (fake sections, symbols permutation), the same seed gives the same binary')
+    args = parser.parse_args(arguments)
+
+    # Every pass draws from the random module, seeded once (from the OS if no seed is given)
+    random.seed(args.seed)
+
+    if os.path.exists(args.binary):
+        measure = tracer.start_measure()
+        elf = elf_patcher(args.binary)
+        trace_pass('map_binary', args.binary, measure)
+
+        elf = apply_passes(elf, args.passes)
+
+        measure = tracer.start_measure()
+        elf.close()
+        trace_pass('save_binary', args.binary, measure)
+        print(good("file saved to : {}".format(args.binary)))
+    else:
+        print('Error, binary doesn\'t exist')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# coding: utf-8
+from elf_model import elf_model, pack_shdr, ELF64_EHDR, ELF64_PHDR, ELF64_SHDR, ELF64_PHDR_SIZE, ELF64_SHDR_SIZE
+
+class elf_patcher(elf_model):
+    # Patch an ELF64 in place through a shared mapping of the file
+    # Each setter writes only the bytes of the field, the file is only grown when data is appended
+    def __init__(self, binary):
+        elf_model.__init__(self, binary, writable=True)
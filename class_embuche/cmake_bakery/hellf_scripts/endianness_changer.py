@@ -3,19 +3,29 @@
 import argparse
 import sys
 import os
-from Hellf import ELF
 from huepy import *
+from elf_patcher import elf_patcher
+
+# Offset of EI_DATA (endianness) in e_ident
+EI_DATA = 5
+ELFDATA2MSB = b"\x02"
+
+# Change the endianness in the ELF header from little to big endian
+def change_endianness(elf):
+    # We change the endianness in the ELF header from little to big endian (Fifth byte)
+    elf.write(EI_DATA, ELFDATA2MSB)
+
+    return elf
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Endianness Changer')
     parser.add_argument('binary', type=str, help='Binary to change endianness')
     args = parser.parse_args()
 
-    if os.path.abspath(args.binary):
-        hellf = ELF(args.binary)
-        # We change the endianness in the ELF header from little to big endian (Fifth byte)
-        hellf.elf_data = hellf.elf_data[:5] + b"\x02" + hellf.elf_data[6:]
-        open(args.binary, "wb").write(hellf.elf_data + b"\n")
+    if os.path.exists(args.binary):
+        elf = elf_patcher(args.binary)
+        elf = change_endianness(elf)
+        elf.close()
         print(good("file saved to : {}".format(args.binary)))
     else:
         print('Error, binary doesn\'t exist')
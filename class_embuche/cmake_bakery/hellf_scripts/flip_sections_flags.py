@@ -3,164 +3,141 @@
 import argparse
 import sys
 import os
-from Hellf import ELF
-from Hellf.lib.elf_structs import *
 from huepy import *
+from elf_patcher import elf_patcher, ELF64_SHDR_SIZE
 
 # Check if we can create fake sections, required no section header table in file
-def check_no_section_header(hellf):
+def check_no_section_header(elf):
     # Check if Section offset is 0 (No section header table)
-    if hellf.Elf64_Ehdr.e_shoff != 0:
+    if elf.get_ehdr('e_shoff') != 0:
         return False
 
     # Check if section header's size in bytes is the size of the Section Header Structure
-    if hellf.Elf64_Ehdr.e_shentsize != len(hellf.Elf64_Shdr):
+    if elf.get_ehdr('e_shentsize') != elf.get_ehdr('e_shnum'):
         return False
 
     return True
 
 # Create a fake .data section with RW instead of RX, point to the .data segment (First LOAD)
-def add_data_section(hellf, strings):
-    PT_LOAD = 0x1
+def add_data_section(elf, strings):
     PF_X = 0x1
     SHT_PROGBITS = 0x1
     SHF_ALLOC = 0x2
     SHF_WRITE = 0x1
 
-    for i in range(hellf.Elf64_Ehdr.e_phnum):
-        # Search LOAD type Program Header
-        if hellf.Elf64_Phdr[i].p_type == PT_LOAD:
-            # Search Executable Segment
-            if (hellf.Elf64_Phdr[i].p_flags & PF_X) == PF_X:
-                data_header = Elf64_Shdr_ST()
-                data_header.sh_name = len(strings)
-                data_header.sh_type = SHT_PROGBITS
+    # Search LOAD type Program Header
+    for i, segment in elf.get_load_segments():
+        # Search Executable Segment
+        if (segment['p_flags'] & PF_X) == PF_X:
+            elf.append_shdr(
+                sh_name=len(strings),
+                sh_type=SHT_PROGBITS,
                 # We change the RX flags for RW
-                data_header.sh_flags = (SHF_ALLOC | SHF_WRITE)
-                data_header.sh_addr = hellf.Elf64_Phdr[i].p_vaddr
-                data_header.sh_offset = hellf.Elf64_Phdr[i].p_offset
-                data_header.sh_size = hellf.Elf64_Phdr[i].p_filesz
-                data_header.sh_link = 0
-                data_header.sh_info = 0
-                data_header.sh_addralign = 4
-                data_header.sh_entsize = 0
-
-                strings += b".data\x00"
-
-                hellf.elf_data += data_header
+                sh_flags=(SHF_ALLOC | SHF_WRITE),
+                sh_addr=segment['p_vaddr'],
+                sh_offset=segment['p_offset'],
+                sh_size=segment['p_filesz'],
+                sh_addralign=4
+            )
+
+            strings += b".data\x00"
+
     # Return the ELF with the fake .data section
-    return hellf, strings
+    return elf, strings
 
 # Create a fake .text section with RX instead of RW, point to the .text segment (Second LOAD)
-def add_text_section(hellf, strings):
-    PT_LOAD = 0x1
+def add_text_section(elf, strings):
     PF_X = 0x1
     SHT_PROGBITS = 0x1
     SHF_ALLOC = 0x2
     SHF_EXECINSTR = 0x4
 
-    for i in range(hellf.Elf64_Ehdr.e_phnum):
-        # Search LOAD type Program Header
-        if hellf.Elf64_Phdr[i].p_type == PT_LOAD:
-            # Search Writable segment
-            if (hellf.Elf64_Phdr[i].p_flags & PF_X) == 0:
-                text_header = Elf64_Shdr_ST()
-                text_header.sh_name = len(strings)
-                text_header.sh_type = SHT_PROGBITS
+    # Search LOAD type Program Header
+    for i, segment in elf.get_load_segments():
+        # Search Writable segment
+        if (segment['p_flags'] & PF_X) == 0:
+            elf.append_shdr(
+                sh_name=len(strings),
+                sh_type=SHT_PROGBITS,
                 # We change the RW flags for RX
-                text_header.sh_flags = (SHF_ALLOC | SHF_EXECINSTR)
-                text_header.sh_addr = hellf.Elf64_Phdr[i].p_vaddr
-                text_header.sh_offset = hellf.Elf64_Phdr[i].p_offset
-                text_header.sh_size = hellf.Elf64_Phdr[i].p_filesz
-                text_header.sh_link = 0
-                text_header.sh_info = 0
-                text_header.sh_addralign = 4
-                text_header.sh_entsize = 0
+                sh_flags=(SHF_ALLOC | SHF_EXECINSTR),
+                sh_addr=segment['p_vaddr'],
+                sh_offset=segment['p_offset'],
+                sh_size=segment['p_filesz'],
+                sh_addralign=4
+            )
 
-                strings += b".text\x00"
-
-                hellf.elf_data += text_header
+            strings += b".text\x00"
 
     # Return the ELF with the fake .text section
-    return hellf, strings
+    return elf, strings
 
 # Create a .shstrtab with the name of our fake sections
-def add_shstrtab_section(hellf, strings):
+def add_shstrtab_section(elf, strings):
     SHT_STRTAB = 0x3
 
-    strtab = Elf64_Shdr_ST()
-    strtab.sh_name = len(strings)
-    strtab.sh_type = SHT_STRTAB
-    strtab.sh_flags = 0
-    strtab.sh_addr = 0
-    # Offset is end of file + 64 byte (Size of section header (shstrtab))
-    strtab.sh_offset = len(hellf.elf_data) + 0x40
-    strtab.sh_size = 0
-    strtab.sh_link = 0
-    strtab.sh_info = 0
-    strtab.sh_addralign = 4
-    strtab.sh_entsize = 0
-
+    sh_name = len(strings)
     strings += b".shstrtab\x00"
 
-    strtab.sh_size = len(strings)
+    elf.append_shdr(
+        sh_name=sh_name,
+        sh_type=SHT_STRTAB,
+        # Offset is end of file + 64 byte (Size of section header (shstrtab))
+        sh_offset=elf.size() + ELF64_SHDR_SIZE,
+        sh_size=len(strings),
+        sh_addralign=4
+    )
 
-    hellf.elf_data += strtab
-    hellf.elf_data += (strtab.sh_offset - len(hellf.elf_data)) * b"\x00"
-
-    hellf.elf_data += strings
+    elf.append(strings)
 
     # Return the ELF with the fake .shstrtab section
-    return hellf, strings
+    return elf, strings
 
 # Create the null section, .data, .text and shstrtab
-def append_sections(hellf):
+def append_sections(elf):
     strings = b"\x00"
 
-    null_header = Elf64_Shdr_ST()
+    elf.append_shdr()
+    elf, strings = add_data_section(elf, strings)
+    elf, strings = add_text_section(elf, strings)
+    elf, strings = add_shstrtab_section(elf, strings)
 
-    hellf.elf_data += null_header
-    hellf, strings = add_data_section(hellf, strings)
-    hellf, strings = add_text_section(hellf, strings)
-    hellf, strings = add_shstrtab_section(hellf, strings)
+    return elf
 
-    return hellf
+# Declare the fake section header table and create the fake sections with flipped flags
+def flip_sections_flags(elf):
+    # Set Section Header Table offset to end of file (we will append our fake sections there)
+    elf.set_ehdr('e_shoff', elf.size())
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Gonna flip some flags')
-    parser.add_argument('binary', type=str, help='Binary to flip section flags (RX->RW, RW->RX)')
-    args = parser.parse_args()
+    # Size of Section 64bits (ELF64)
+    elf.set_ehdr('e_shentsize', ELF64_SHDR_SIZE)
 
-    if os.path.abspath(args.binary):
-        hellf = ELF(args.binary)
+    # We declare 4 fake section (A SHT_NULL one, .data, .text and .shstrtab)
+    elf.set_ehdr('e_shnum', 4)
 
-        # Check if no section present in ELF
-        if check_no_section_header(hellf):
-            # This is dirty, but otherwise Hellf doesn't save the header only the raw data
+    # 3 names for our fake section
+    elf.set_ehdr('e_shstrndx', 3)
 
-            # Equivalent of hellf.Elf64_Ehdr.e_shoff = len(hellf.elf_data)
-            # Set Section Header Table offset to end of file (we will append our fake sections there)
-            e_shoff = len(hellf.elf_data).to_bytes(4, 'little')
-            hellf.elf_data = hellf.elf_data[:40] + e_shoff + hellf.elf_data[44:]
+    # Create fake sections
+    elf = append_sections(elf)
 
-            # Equivalent of hellf.Elf64_Ehdr.e_shentsize = 0x40
-            # Size of Section 64bits (ELF64)
-            hellf.elf_data = hellf.elf_data[:58] + b"\x40" + hellf.elf_data[59:]
+    return elf
 
-            # Equivalent of hellf.Elf64_Ehdr.e_shnum = 0x4
-            # We declare 4 fake section (A SHT_NULL one, .data, .text and .shstrtab)
-            hellf.elf_data = hellf.elf_data[:60] + b"\x04" + hellf.elf_data[61:]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Gonna flip some flags')
+    parser.add_argument('binary', type=str, help='Binary to flip section flags (RX->RW, RW->RX)')
+    args = parser.parse_args()
 
-            # Equivalent of hellf.Elf64_Ehdr.e_shstrndx = 0x3
-            # 3 names for our fake section
-            hellf.elf_data = hellf.elf_data[:62] + b"\x03" + hellf.elf_data[63:]
+    if os.path.exists(args.binary):
+        elf = elf_patcher(args.binary)
 
-            # Create fake sections
-            hellf = append_sections(hellf)
+        # Check if no section present in ELF
+        if check_no_section_header(elf):
+            elf = flip_sections_flags(elf)
 
-            # Replace the binary
-            open(args.binary, "wb").write(hellf.elf_data + b"\n")
             print(good("file saved to : {}".format(args.binary)))
 
+        elf.close()
+
     else:
         print('Error, binary doesn\'t exist')
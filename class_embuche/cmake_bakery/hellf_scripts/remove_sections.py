@@ -2,33 +2,35 @@
 # coding: utf-8
 import argparse
 import os
-from Hellf import ELF
 from huepy import *
+from elf_patcher import elf_patcher
+
+# Set e_shoff, e_shentsize, e_shnum and e_shstrndx to 0 in the ELF header
+def remove_section_header(elf):
+    elf.set_ehdr('e_shoff', 0)
+
+    # Size of Section 64bits (ELF64)
+    elf.set_ehdr('e_shentsize', 0)
+
+    # We declare 0 fake section
+    elf.set_ehdr('e_shnum', 0)
+
+    # No name section
+    elf.set_ehdr('e_shstrndx', 0)
+
+    return elf
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Remove section header')
     parser.add_argument('binary', type=str, help='Binary to remove section header')
     args = parser.parse_args()
 
-    if os.path.abspath(args.binary):
-        hellf = ELF(args.binary)
-
-        # Equivalent of hellf.Elf64_Ehdr.e_shoff = 0
-        hellf.elf_data = hellf.elf_data[:40] + b"\x00\x00\x00\x00" + hellf.elf_data[44:]
-
-        # Equivalent of hellf.Elf64_Ehdr.e_shentsize = 0
-        # Size of Section 64bits (ELF64)
-        hellf.elf_data = hellf.elf_data[:58] + b"\x00" + hellf.elf_data[59:]
-
-        # Equivalent of hellf.Elf64_Ehdr.e_shnum = 0
-        # We declare 0 fake section
-        hellf.elf_data = hellf.elf_data[:60] + b"\x00" + hellf.elf_data[61:]
+    if os.path.exists(args.binary):
+        elf = elf_patcher(args.binary)
 
-        # Equivalent of hellf.Elf64_Ehdr.e_shstrndx = 0
-        # No name section
-        hellf.elf_data = hellf.elf_data[:62] + b"\x00" + hellf.elf_data[63:]
+        elf = remove_section_header(elf)
 
-        open(args.binary, "wb").write(hellf.elf_data + b"\n")
+        elf.close()
         print(good("file saved to : {}".format(args.binary)))
     else:
         print('Error, binary doesn\'t exist')
@@ -0,0 +1,9 @@
+#ifndef PACKER2_COMPRESSION_H
+#define PACKER2_COMPRESSION_H
+
+// size of the compressed binary given to the decompressor at once
+#define DECOMPRESSION_CHUNK_SIZE (1024 * 1024)
+
+int decompress_payload(unsigned char *out, unsigned long long out_size, unsigned char *in, unsigned long long in_size, unsigned int compression);
+
+#endif //PACKER2_COMPRESSION_H
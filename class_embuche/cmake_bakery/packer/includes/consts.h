@@ -1,9 +1,52 @@
 #ifndef CONSTS_H
 #define CONSTS_H
 
-#define METADATA_SIZE 16
-#define REAL_SIZE BIN_SIZE
-#define TO_BE_PACKED_SIZE (REAL_SIZE - METADATA_SIZE)
+// size of the .fini. section, the ciphered binary is appended at the end of the packer so the packer doesn't depend on its size
+#define METADATA_SIZE 112
+
+// packing modes, stored in the flags of the metadata
+#define FLAG_ENVELOPE 1
+// the binary is ciphered with AES-256-CTR instead of AES-256-CBC
+#define FLAG_CTR 2
+// the key is derived from the tree hash of .text (chunks hashed in parallel) instead of its sha256
+#define FLAG_TREE_HASH 4
+
+// compression of the binary before it's ciphered, stored in the compression of the metadata
+#define COMPRESSION_NONE 0
+#define COMPRESSION_ZLIB 1
+#define COMPRESSION_LZMA 2
+
+/* metadata stored in the .fini. section, the ciphered binary is at payload_offset (must match packer.py)
+ * in envelope mode the binary is ciphered once with a random data key, only the data key is ciphered with sha256(.text) ^ timestamp
+ * so only the timestamp and the wrapped key change at each run, they are saved next to the binary (struct envelope_state)
+ */
+struct metadata {
+	unsigned long long timestamp;        // timestamp of the last run, 0 before the first run
+	unsigned long long section_offset;   // offset of the .fini. section on disk
+	unsigned int flags;                  // packing mode
+	unsigned int block_size;             // size of the blocks deciphered at once (DEFAULT_BLOCK_SIZE if 0)
+	unsigned long long payload_size;     // size of the packed binary without padding
+	unsigned char data_iv[16];           // iv of the ciphered binary in envelope mode
+	unsigned char wrapped_key[32];       // data key ciphered with sha256(.text) ^ timestamp in envelope mode
+	unsigned int threads;                // number of threads deciphering the binary (number of CPU if 0)
+	unsigned int compression;            // compression of the binary before it's ciphered
+	unsigned long long compressed_size;  // size of the compressed binary without padding (ciphered size)
+	unsigned long long payload_offset;   // offset of the ciphered binary on disk (end of the packer)
+	unsigned int tree_chunk_size;        // size of the chunks of .text hashed separately with FLAG_TREE_HASH
+	unsigned char reserved[4];
+} __attribute__ ((packed));
+
+// file next to the binary where the envelope mode saves its state, <binary>.envelope
+#define ENVELOPE_SUFFIX ".envelope"
+
+/* state of the envelope mode saved at each run instead of rewriting the binary (must match depack.py)
+ * the state belongs to the binary with the same data iv, the metadata of the binary is used if there's no state or if it's the one of another packing
+ */
+struct envelope_state {
+	unsigned char data_iv[16];           // data iv of the binary the state belongs to
+	unsigned long long timestamp;        // timestamp of the last run
+	unsigned char wrapped_key[32];       // data key ciphered with sha256(.text) ^ timestamp
+} __attribute__ ((packed));
 
 
 
@@ -15,7 +58,7 @@
     #define handle_error(msg) do {exit(EXIT_FAILURE);} while(0)
 #endif
 
-extern char stack[REAL_SIZE] __attribute__ ((section (".fini.")));
+extern char surprise_section[METADATA_SIZE] __attribute__ ((section (".fini.")));
 extern unsigned char *iv;
 
 extern char *current_binary_name;
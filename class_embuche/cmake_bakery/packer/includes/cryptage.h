@@ -7,7 +7,53 @@ union SALT {
     unsigned long _long;
 };
 
+#include <pthread.h>
+#include <openssl/evp.h>
+
+// size of the blocks deciphered at once if it's not set in the metadata
+#define DEFAULT_BLOCK_SIZE (1024 * 1024)
+// minimum size of the part of the binary deciphered by a thread
+#define MIN_THREAD_SIZE (1024 * 1024)
+
+struct metadata;
+
+// part of .text hashed by a thread, chunk by chunk (tree hash)
+struct hash_job {
+    unsigned char *in;
+    long size;
+    long chunk_size;
+    unsigned char *digests;
+    int started;
+    pthread_t thread;
+};
+
+// part of the binary (de)ciphered by a thread
+struct cipher_job {
+    unsigned char *out;
+    unsigned char *in;
+    long size;
+    unsigned char iv[16];
+    unsigned char *key;
+    const EVP_CIPHER *cipher;
+    int enc;
+    long block_size;
+    int success;
+    int started;
+    pthread_t thread;
+};
+
 void do_sha256(unsigned char *hash, unsigned char *addr, long size);
-void decrypt(unsigned char *ciphertext, int fd_d);
+void * run_hash_job(void *arg);
+void tree_hash(unsigned char *hash, unsigned char *addr, long size, long chunk_size, struct metadata *metadata);
+void wrap_key(unsigned char *out, unsigned char *in, unsigned char *key, int enc);
+void add_counter(unsigned char *counter, unsigned char *iv, long blocks);
+void * run_cipher_job(void *arg);
+long get_threads_count(struct metadata *metadata, long size);
+int cipher_parallel(unsigned char *out, unsigned char *in, long size, unsigned char *key, unsigned char *payload_iv, struct metadata *metadata, int enc);
+unsigned long long get_ciphered_size(struct metadata *metadata);
+unsigned long long get_padded_size(struct metadata *metadata);
+int decrypt_payload(unsigned char *plaintext, unsigned char *ciphertext, unsigned char *key, unsigned char *payload_iv, struct metadata *metadata);
+void encrypt_payload(unsigned char *plaintext, unsigned long long payload_offset, unsigned char *key, struct metadata *metadata);
+void decrypt(unsigned char *section, int fd_d);
 
 #endif //PACKER2_CRYPTAGE_H
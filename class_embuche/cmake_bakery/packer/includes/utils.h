@@ -4,10 +4,17 @@
 	#include "cryptage.h"
 #endif
 
+struct metadata;
+struct envelope_state;
+
+int clone_binary(int in, int out);
 void save_binary();
-unsigned char * get_text_hash();
+void load_envelope_state(struct envelope_state *state, struct metadata *metadata);
+void save_envelope_state(struct envelope_state *state);
+unsigned char * get_text_hash(struct metadata *metadata);
 void preparing_timestamp(union SALT *salt);
-void generate_key(unsigned char *new_key, union SALT *salt);
+void generate_key(unsigned char *new_key, unsigned char *text_hash, union SALT *salt);
+char * get_binary_image(unsigned long offset, long size);
 void write_to_binary(char *what, int size, unsigned long offset);
 
 #endif /* UTILS_H */
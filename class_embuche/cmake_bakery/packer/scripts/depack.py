@@ -2,9 +2,13 @@
 from Hellf import ELF
 from hashlib import sha256
 from binascii import hexlify
+from os.path import exists
 from sys import argv
 from struct import unpack, pack
 
+import lzma
+import zlib
+
 from Crypto.Cipher import AES
 
 e = ELF(argv[1])
@@ -14,10 +18,35 @@ text = e.get_section_by_name(".text")
 timestamp = surprise.data[:8]
 timestamp_readable = unpack("<Q", timestamp)[0]
 
+# metadata, see packer.py
+flags, = unpack("<I", surprise.data[16:20])
+data_iv = surprise.data[32:48]
+wrapped_key = surprise.data[48:80]
+compression, compressed_size, payload_offset, tree_chunk_size = unpack("<IQQI", surprise.data[84:108])
+payload_size, = unpack("<Q", surprise.data[24:32])
+
+# envelope mode, the timestamp and the wrapped key of the last run are next to the binary (struct envelope_state in includes/consts.h)
+if flags & 1 and exists(argv[1] + ".envelope"):
+    with open(argv[1] + ".envelope", "rb") as envelope:
+        state = envelope.read()
+
+    if len(state) == 56 and state[:16] == bytes(data_iv):
+        timestamp = state[16:24]
+        wrapped_key = state[24:56]
+
+# the ciphered binary is appended at the end of the packer
+with open(argv[1], "rb") as packed:
+    packed.seek(payload_offset)
+    ciphered = packed.read(((compressed_size if compression else payload_size) // 16 + 1) * 16)
+
 timestamp = timestamp[:4] * 2
 
-text_hash = sha256(text.data).digest()
-text_hash_test = sha256(text.data).hexdigest()
+if flags & 4:
+    # tree hash, sha256 of the sha256 of each chunk of .text
+    text_data = bytes(text.data)
+    text_hash = sha256(b"".join(sha256(text_data[i : i + tree_chunk_size]).digest() for i in range(0, len(text_data), tree_chunk_size))).digest()
+else:
+    text_hash = sha256(text.data).digest()
 
 key = b"".join([pack("<B", text_hash[i] ^ timestamp[i % 8]) for i in range(len(text_hash))])
 
@@ -25,6 +54,21 @@ key = b"".join([pack("<B", text_hash[i] ^ timestamp[i % 8]) for i in range(len(t
 
 iv = b"0123456789012345"
 
-c = AES.new(key, AES.MODE_CBC, iv)
+if flags & 1:
+    # envelope mode, the key of the run deciphers the data key
+    key = AES.new(key, AES.MODE_CBC, iv).decrypt(wrapped_key)
+    iv = data_iv
+
+if flags & 2:
+    c = AES.new(key, AES.MODE_CTR, nonce=b"", initial_value=iv)
+else:
+    c = AES.new(key, AES.MODE_CBC, iv)
+
+plaintext = c.decrypt(ciphered)
+
+if compression == 1:
+    plaintext = zlib.decompress(plaintext[:compressed_size])
+elif compression == 2:
+    plaintext = lzma.decompress(plaintext[:compressed_size])
 
-print(c.decrypt(surprise.data[16:]))
+print(plaintext)
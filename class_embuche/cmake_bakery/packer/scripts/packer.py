@@ -1,68 +1,321 @@
 #!/usr/bin/python3
-from Hellf import ELF
 from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad
 
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
 from hashlib import sha256
-from huepy import good
-from os import stat
-from struct import pack
-from sys import argv
+from huepy import good, bad
+from os import cpu_count, stat
+from os.path import dirname, realpath
+from shutil import copyfile
+from struct import pack, unpack_from
+from sys import exit, path
+from tempfile import TemporaryFile
+from time import perf_counter
+
+import lzma
+import zlib
+
+# the steps are appended to the trace of Embuche with its tracer (standard library only)
+path.insert(0, dirname(dirname(dirname(dirname(dirname(realpath(__file__)))))))
+from class_embuche.tracer import record, start_measure
+
+# size of the chunks read from the binary to be packed, it must be a multiple of the AES block size
+CHUNK_SIZE = 1024 * 1024
+
+# metadata stored in the .fini. section of the packer (struct metadata in includes/consts.h):
+# timestamp of the last run, offset of .fini. on disk, flags, block size, size of the binary, data iv, wrapped data key, number of threads,
+# compression, size of the compressed binary, offset of the ciphered binary (appended at the end of the packer) and size of the chunks of the tree hash
+METADATA_FORMAT = "<QQIIQ16s32sIIQQI4x"
+METADATA_SIZE = 112
 
+# packing modes
+FLAG_ENVELOPE = 1
+FLAG_CTR = 2
+FLAG_TREE_HASH = 4
 
-def get_size_once_padded(binary, metadata_size):
+# size of the chunks of .text hashed separately by the tree hash
+DEFAULT_TREE_CHUNK_SIZE = 64 * 1024
+
+# compression of the binary before it's ciphered
+COMPRESSIONS = {"none": 0, "zlib": 1, "lzma": 2}
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# size of the blocks deciphered at once by the packer at runtime
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def get_compressor(compression, level):
     """
-    Getting the size of the binary once padded.
+    Getting a streaming compressor (compress and flush methods), None if the binary isn't compressed.
     """
-    bin_size = stat(binary).st_size
+    if compression == "zlib":
+        return zlib.compressobj(level)
+    elif compression == "lzma":
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
 
-    tmp = bin_size % 16
-    padding_size = 16 - tmp if tmp != 0 else 16
+    return None
 
-    return bin_size + padding_size + metadata_size
 
+def compress_stream(source, target, compressor):
+    """
+    Compressing source chunk by chunk into target, return the size of the compressed binary.
+    """
+    written = 0
 
-if __name__ == "__main__":
-    # two ways to use this scripts
-    # - 1 args, it return the size once padded of the provided binary
-    # - 3 args, it encrypt the provided binary, and store it in an additional section .fini.
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        written += target.write(compressor.compress(chunk))
+
+    return written + target.write(compressor.flush())
+
+
+def get_sections(binary):
+    """
+    Getting the offset and size on disk of each section, only the section header table and the names are read.
+    """
+    with open(binary, "rb") as elf:
+        ehdr = elf.read(64)
+        (e_shoff,) = unpack_from("<Q", ehdr, 0x28)
+        e_shentsize, e_shnum, e_shstrndx = unpack_from("<HHH", ehdr, 0x3A)
+
+        elf.seek(e_shoff)
+        table = elf.read(e_shentsize * e_shnum)
+        # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize
+        headers = [unpack_from("<IIQQQQIIQQ", table, i * e_shentsize) for i in range(e_shnum)]
+
+        elf.seek(headers[e_shstrndx][4])
+        names = elf.read(headers[e_shstrndx][5])
+
+    return {
+        names[header[0] : names.index(b"\x00", header[0])].decode(): (header[4], header[5])
+        for header in headers
+    }
+
+
+def hash_range(binary, offset, size):
+    """
+    Computing the sha256 of a part of a file.
+    """
+    text_sum = sha256()
+
+    with open(binary, "rb") as elf:
+        elf.seek(offset)
+        while size > 0:
+            chunk = elf.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                break
+            text_sum.update(chunk)
+            size -= len(chunk)
+
+    return text_sum.hexdigest()
+
+
+def tree_hash_range(binary, offset, size, chunk_size):
+    """
+    Computing the tree hash of a part of a file (like tree_hash in src/cryptage.c):
+    sha256 of the concatenation of the sha256 of each chunk, the chunks are hashed in parallel.
+    """
+    with open(binary, "rb") as elf:
+        elf.seek(offset)
+        data = memoryview(elf.read(size))
+
+    # hashlib releases the GIL while hashing a chunk
+    with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
+        digests = executor.map(lambda start: sha256(data[start : start + chunk_size]).digest(), range(0, len(data), chunk_size))
+
+        return sha256(b"".join(digests)).hexdigest()
+
+
+def hash_text(binary, offset, size, key_derivation, chunk_size):
+    """
+    Computing the hash of .text the key is derived from, sha256 or tree hash.
+    """
+    if key_derivation == "tree":
+        return tree_hash_range(binary, offset, size, chunk_size)
+
+    return hash_range(binary, offset, size)
 
-    if len(argv) == 2:
-        print(get_size_once_padded(argv[1], 16), end="")
 
-    elif len(argv) == 4:
-        unloaded = ELF(argv[1])
+def derive_bytes(seed, label, size):
+    """
+    Deriving size bytes from the seed of a variant, the same seed gives the same data key.
+    """
+    return sha256(label + seed.to_bytes(16, "little")).digest()[:size]
+
+
+def trace(name, measure, **args):
+    """
+    Appending the timing of a step to the trace of Embuche if one is recorded (measure started with start_measure).
+    """
+    record(name, "packer", measure, process="packer.py", **args)
+
+
+def encrypt_stream(source, target, encryptor):
+    """
+    Encrypting source chunk by chunk into target, the last chunk is padded.
+    Only two chunks are in memory at once whatever the size of the binary.
+    """
+    written = 0
+    chunk = source.read(CHUNK_SIZE)
+
+    while True:
+        next_chunk = source.read(CHUNK_SIZE)
+
+        if not next_chunk:
+            chunk = pad(chunk, 16)
+
+        written += target.write(encryptor.encrypt(chunk))
+
+        if not next_chunk:
+            return written
+
+        chunk = next_chunk
+
+
+def main(arguments=None):
+    """
+    Packing the binary given in the arguments (command line if None), it's also called by the daemon of Embuche.
+    """
+    # the packer (unloaded stub) is built once, it's copied in the output with the metadata in its .fini. section and the ciphered binary at the end
+    parser = ArgumentParser(description="Cipher a binary and append it to the packer, its size and offset are stored in the .fini. section")
+    parser.add_argument("binaries", nargs=3, help="the packer (unloaded stub), the binary to be packed and the output")
+    parser.add_argument("--envelope", action="store_true", help="cipher the binary with a random data key, only the data key is ciphered again at each run")
+    parser.add_argument("--mode", choices=["cbc", "ctr"], default="cbc", help="AES-256 mode, with ctr the packer also ciphers the binary again in parallel at runtime (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=0, help="number of threads deciphering the binary at runtime, 0 for the number of CPU (default: %(default)s)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="size in bytes of the blocks deciphered at once at runtime, multiple of 16 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=None, help="seed (128 bits) of the data key of the envelope mode, random if not set")
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="none", help="compression of the binary before it's ciphered, it's decompressed in the memfd at runtime (default: %(default)s)")
+    parser.add_argument("--compression-level", type=int, default=DEFAULT_COMPRESSION_LEVEL, help="level of zlib (0-9) or preset of lzma (0-9) (default: %(default)s)")
+    parser.add_argument("--key-derivation", choices=["sha256", "tree"], default="sha256", help="hash of .text the key is derived from, tree hashes the chunks of .text in parallel (default: %(default)s)")
+    parser.add_argument("--tree-chunk-size", type=int, default=DEFAULT_TREE_CHUNK_SIZE, help="size in bytes of the chunks of the tree hash (default: %(default)s)")
+    args = parser.parse_args(arguments)
 
-        # :/
-        iv = b"0123456789012345"
+    if args.block_size <= 0 or args.block_size % 16 != 0 or args.block_size >= 2 ** 31:
+        parser.error("the block size must be a positive multiple of 16")
 
-        surprise = unloaded.get_section_by_name(".fini.")
-        text = unloaded.get_section_by_name(".text")
+    if args.threads < 0 or args.threads >= 2 ** 32:
+        parser.error("the number of threads must be positive or 0")
 
-        # computing .text section sha256
-        text_sum = sha256(text.data).hexdigest()
-        print(good(".text sha256 sum : ") + text_sum)
+    if args.seed is not None and (args.seed < 0 or args.seed >= 2 ** 128):
+        parser.error("the seed must be a positive number of 128 bits")
 
-        key = bytearray.fromhex(text_sum)
+    if args.compression_level < 0 or args.compression_level > 9:
+        parser.error("the compression level must be between 0 and 9")
 
-        binary_to_be_packed = pad(open(argv[2], "rb").read(), 16)
+    if args.tree_chunk_size <= 0 or args.tree_chunk_size >= 2 ** 31:
+        parser.error("the size of the chunks of the tree hash must be positive")
+    stub, binary, output = args.binaries
 
-        encryptor = AES.new(key, AES.MODE_CBC, iv)
+    trace_measure = start_measure()
+    sections = get_sections(stub)
 
-        # we are adding 16 bytes of metada, which are the place holder for the timestamp of the last run and the address of the .fini. section on disk.
-        encrypted = (
-            pack("<Q", 0)
-            + pack("<Q", surprise.sh_offset)
-            + encryptor.encrypt(binary_to_be_packed)
-        )
+    # :/
+    iv = b"0123456789012345"
 
-        surprise.data = encrypted
-        print(good("encrypted binary size : {}".format(len(encrypted))))
+    surprise_offset, surprise_size = sections[".fini."]
+    text_offset, text_size = sections[".text"]
 
-        unloaded.save(argv[3])
+    if surprise_size != METADATA_SIZE:
+        print(bad("the .fini. section ({} bytes) doesn't fit the metadata ({} bytes)".format(surprise_size, METADATA_SIZE)))
+        exit(1)
 
-        # unit test
-        assert (
-            sha256(ELF(argv[3]).get_section_by_name(".text").data).hexdigest()
-            == text_sum
-        ), "The added section data seems corrupted !".upper()
+    # computing .text section sha256 (or tree hash)
+    text_sum = hash_text(stub, text_offset, text_size, args.key_derivation, args.tree_chunk_size)
+    print(good(".text {} sum : ".format(args.key_derivation)) + text_sum)
+    trace("hash_text", trace_measure)
+
+    key = bytearray.fromhex(text_sum)
+
+    binary_size = stat(binary).st_size
+
+    if args.envelope:
+        # the binary is ciphered with a random data key, the data key is ciphered with the key of the first run
+        if args.seed is None:
+            data_key = get_random_bytes(32)
+            data_iv = get_random_bytes(16)
+        else:
+            data_key = derive_bytes(args.seed, b"data_key", 32)
+            data_iv = derive_bytes(args.seed, b"data_iv", 16)
+        wrapped_key = AES.new(key, AES.MODE_CBC, iv).encrypt(data_key)
+        payload_key, payload_iv = data_key, data_iv
+        flags = FLAG_ENVELOPE
+    else:
+        data_iv = bytes(16)
+        wrapped_key = bytes(32)
+        payload_key, payload_iv = key, iv
+        flags = 0
+
+    if args.key_derivation == "tree":
+        flags |= FLAG_TREE_HASH
+
+    if args.mode == "ctr":
+        # the counter is the whole iv (128 bits big endian), like EVP_aes_256_ctr
+        encryptor = AES.new(payload_key, AES.MODE_CTR, nonce=b"", initial_value=payload_iv)
+        flags |= FLAG_CTR
+    else:
+        encryptor = AES.new(payload_key, AES.MODE_CBC, payload_iv)
+
+    with open(binary, "rb") as source, TemporaryFile() as compressed:
+        compressor = get_compressor(args.compression, args.compression_level)
+
+        if compressor is not None:
+            # the binary is compressed in a temporary file which is ciphered in place of the binary
+            trace_measure = start_measure()
+            payload_size = compress_stream(source, compressed, compressor)
+            compressed.seek(0)
+            source = compressed
+            trace("compress_payload", trace_measure, compression=args.compression, size=binary_size, compressed_size=payload_size)
+
+            print(good("compressed binary size : {} ({}, ratio {:.2f})".format(payload_size, args.compression, binary_size / max(payload_size, 1))))
+        else:
+            payload_size = binary_size
+
+        # the stub is copied as is, then the encrypted binary is appended at the end of the copy
+        copyfile(stub, output)
+        payload_offset = stat(output).st_size
+
+        start = perf_counter()
+        trace_measure = start_measure()
+
+        with open(output, "r+b") as target:
+            target.seek(payload_offset)
+            encrypted_size = encrypt_stream(source, target, encryptor)
+
+            # we are adding the metadata in the .fini. section, the timestamp of the last run is a place holder,
+            # the address of the .fini. section on disk is used to write the section at runtime and the ciphered binary is found at its offset
+            target.seek(surprise_offset)
+            target.write(
+                pack(
+                    METADATA_FORMAT,
+                    0,
+                    surprise_offset,
+                    flags,
+                    args.block_size,
+                    binary_size,
+                    data_iv,
+                    wrapped_key,
+                    args.threads,
+                    COMPRESSIONS[args.compression],
+                    payload_size,
+                    payload_offset,
+                    args.tree_chunk_size,
+                )
+            )
+
+        duration = perf_counter() - start
+        trace("encrypt_payload", trace_measure, size=encrypted_size, mode=args.mode, envelope=args.envelope)
+
+    print(good("encrypted binary size : {}".format(encrypted_size)))
+    print(good("encrypted at {:.2f} MB/s".format(encrypted_size / (1024 * 1024) / max(duration, 1e-9))))
+
+    # unit test
+    trace_measure = start_measure()
+    assert hash_text(output, text_offset, text_size, args.key_derivation, args.tree_chunk_size) == text_sum, "The added section data seems corrupted !".upper()
+    trace("verify_text", trace_measure)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+//
+// Decompression of the binary in the anonymous file, zlib and lzma are only linked if the binary has been compressed with them
+//
+#include <stddef.h>
+
+#ifdef EMBUCHE_ZLIB
+    #include <zlib.h>
+#endif
+#ifdef EMBUCHE_LZMA
+    #include <lzma.h>
+#endif
+
+#include "compression.h"
+#include "consts.h"
+
+#ifdef EMBUCHE_ZLIB
+// inflates the zlib stream in to out by chunks, the whole stream must give exactly out_size bytes
+int inflate_payload(unsigned char *out, unsigned long long out_size, unsigned char *in, unsigned long long in_size) {
+
+    z_stream stream = {0};
+    int ret = Z_OK;
+
+    if ( inflateInit(&stream) != Z_OK ) return 0;
+
+    stream.next_out = out;
+
+    while ( ret == Z_OK ) {
+
+        // the sizes of zlib are 32 bits, the input and the output are given by chunks
+        if ( stream.avail_in == 0 ) {
+            unsigned long long left = in_size - stream.total_in;
+            stream.next_in = in + stream.total_in;
+            stream.avail_in = left > DECOMPRESSION_CHUNK_SIZE ? DECOMPRESSION_CHUNK_SIZE : left;
+        }
+        if ( stream.avail_out == 0 ) {
+            unsigned long long left = out_size - stream.total_out;
+            stream.avail_out = left > DECOMPRESSION_CHUNK_SIZE ? DECOMPRESSION_CHUNK_SIZE : left;
+        }
+
+        // nothing left to give, the stream is truncated (the end of the stream is read even if the output is full)
+        if ( stream.avail_in == 0 ) break;
+
+        ret = inflate(&stream, Z_NO_FLUSH);
+    }
+
+    int success = ret == Z_STREAM_END && stream.total_out == out_size;
+
+    inflateEnd(&stream);
+
+    return success;
+}
+#endif
+
+#ifdef EMBUCHE_LZMA
+// decodes the xz stream in to out, the integrity check of the stream is verified by the decoder
+int unxz_payload(unsigned char *out, unsigned long long out_size, unsigned char *in, unsigned long long in_size) {
+
+    lzma_stream stream = LZMA_STREAM_INIT;
+
+    if ( lzma_stream_decoder(&stream, UINT64_MAX, 0) != LZMA_OK ) return 0;
+
+    stream.next_in = in;
+    stream.avail_in = in_size;
+    stream.next_out = out;
+    stream.avail_out = out_size;
+
+    int success = lzma_code(&stream, LZMA_FINISH) == LZMA_STREAM_END && stream.total_out == out_size;
+
+    lzma_end(&stream);
+
+    return success;
+}
+#endif
+
+/* decompresses the deciphered binary (in) straight into the anonymous file (out), the decompressed binary is never copied
+ * returns 0 if the compressed binary is corrupted (wrong key in CTR mode) or if the packer has been built without this compression
+ */
+int decompress_payload(unsigned char *out, unsigned long long out_size, unsigned char *in, unsigned long long in_size, unsigned int compression) {
+
+    (void) out; (void) out_size; (void) in; (void) in_size;
+
+    switch ( compression ) {
+#ifdef EMBUCHE_ZLIB
+        case COMPRESSION_ZLIB:
+            return inflate_payload(out, out_size, in, in_size);
+#endif
+#ifdef EMBUCHE_LZMA
+        case COMPRESSION_LZMA:
+            return unxz_payload(out, out_size, in, in_size);
+#endif
+        default:
+            return 0;
+    }
+}
@@ -1,18 +1,26 @@
 //
 // Created by switch on 6/4/20.
 //
+#define _GNU_SOURCE
 #include <stdio.h>
+#include <stdlib.h>
+#include <stddef.h>
 #include <unistd.h>
-#include <math.h>
 #include <string.h>
 #include <time.h>
+#include <sys/mman.h>
+#include <pthread.h>
+#include <elf.h>
 
 #include <openssl/conf.h>
 #include <openssl/evp.h>
 #include <openssl/sha.h>
+#include <openssl/crypto.h>
+#include <openssl/aes.h>
 
 #include "utils.h"
 #include "cryptage.h"
+#include "compression.h"
 #include "consts.h"
 
 // performs sha256 of the given memory space
@@ -24,29 +32,300 @@ void do_sha256(unsigned char *hash, unsigned char *addr, long size) {
     SHA256_Final(hash, &sha256);
 }
 
-void decrypt(unsigned char *ciphertext, int fd_d)
-{
-    EVP_CIPHER_CTX *decrypt_ctx, *encrypt_ctx;
+// hashes the chunks of the part of .text of a job, the digest of each chunk is written at its index
+void * run_hash_job(void *arg) {
+
+    struct hash_job *job = (struct hash_job *) arg;
+
+    for ( long i = 0; i < job->size; i += job->chunk_size ) {
+
+        long size = (job->size - i) > job->chunk_size ? job->chunk_size : job->size - i;
+
+        do_sha256(job->digests + (i / job->chunk_size) * SHA256_DIGEST_LENGTH, job->in + i, size);
+    }
+
+    return NULL;
+}
+
+/* tree hash of size bytes (must match packer.py): sha256 of the concatenation of the sha256 of each chunk of chunk_size bytes
+ * the chunks are split between the threads (like the deciphering), each thread hashes its own chunks
+ */
+void tree_hash(unsigned char *hash, unsigned char *addr, long size, long chunk_size, struct metadata *metadata) {
+
+    if ( chunk_size <= 0 ) handle_error("invalid tree hash chunk size");
+
+    long chunks = (size + chunk_size - 1) / chunk_size;
+    long threads = get_threads_count(metadata, size);
+
+    if ( threads > chunks ) threads = chunks;
+    if ( threads < 1 ) threads = 1;
+
+    long chunks_per_thread = (chunks + threads - 1) / threads;
+
+    unsigned char *digests = malloc(chunks * SHA256_DIGEST_LENGTH + 1);
+    struct hash_job *jobs = calloc(threads, sizeof(struct hash_job));
+    if ( digests == NULL || jobs == NULL ) handle_error("malloc tree hash");
+
+    long jobs_count = 0;
+
+    for ( long first = 0; first < chunks && jobs_count < threads; first += chunks_per_thread, jobs_count++ ) {
+
+        struct hash_job *job = &jobs[jobs_count];
+
+        job->in = addr + first * chunk_size;
+        job->size = (size - first * chunk_size) > chunks_per_thread * chunk_size ? chunks_per_thread * chunk_size : size - first * chunk_size;
+        job->chunk_size = chunk_size;
+        job->digests = digests + first * SHA256_DIGEST_LENGTH;
+    }
+
+    // the last part is hashed by the current thread, the part is done in the current thread as well if the thread can't be created
+    for ( long i = 0; i < jobs_count; i++ ) {
+        jobs[i].started = i < jobs_count - 1 && pthread_create(&jobs[i].thread, NULL, run_hash_job, &jobs[i]) == 0;
+        if ( !jobs[i].started ) run_hash_job(&jobs[i]);
+    }
+
+    for ( long i = 0; i < jobs_count; i++ ) {
+        if ( jobs[i].started ) pthread_join(jobs[i].thread, NULL);
+    }
+
+    do_sha256(hash, digests, chunks * SHA256_DIGEST_LENGTH);
+
+    free(jobs);
+    free(digests);
+}
+
+// ciphers (enc = 1) or deciphers (enc = 0) a 32 bytes key, without padding
+void wrap_key(unsigned char *out, unsigned char *in, unsigned char *key, int enc) {
+
+    EVP_CIPHER_CTX *ctx;
+    int len, final_len;
+
+    if ( !(ctx = EVP_CIPHER_CTX_new()) ) handle_error("can't initiat context");
+
+    if ( 1 != EVP_CipherInit_ex(ctx, EVP_aes_256_cbc(), NULL, key, iv, enc)
+        || 1 != EVP_CIPHER_CTX_set_padding(ctx, 0)
+        || 1 != EVP_CipherUpdate(ctx, out, &len, in, SHA256_DIGEST_LENGTH)
+        || 1 != EVP_CipherFinal_ex(ctx, out + len, &final_len)) handle_error("can't wrap key");
+
+    EVP_CIPHER_CTX_free(ctx);
+}
+
+// counter of the block number blocks, iv + blocks as a 128 bits big endian number (like EVP_aes_256_ctr)
+void add_counter(unsigned char *counter, unsigned char *iv, long blocks) {
+
+    unsigned long carry = (unsigned long) blocks;
+
+    for ( int i = AES_BLOCK_SIZE - 1; i >= 0; i-- ) {
+        carry += iv[i];
+        counter[i] = carry & 0xff;
+        carry >>= 8;
+    }
+}
+
+// (de)ciphers the part of the binary of a job by blocks of block_size bytes, without padding
+void * run_cipher_job(void *arg) {
+
+    struct cipher_job *job = (struct cipher_job *) arg;
+    EVP_CIPHER_CTX *ctx;
+    int len;
+
+    job->success = 0;
+
+    if ( !(ctx = EVP_CIPHER_CTX_new()) ) return NULL;
+
+    if ( 1 == EVP_CipherInit_ex(ctx, job->cipher, NULL, job->key, job->iv, job->enc) && 1 == EVP_CIPHER_CTX_set_padding(ctx, 0) ) {
+
+        job->success = 1;
+
+        for ( long i = 0; i < job->size && job->success; i += job->block_size ) {
+
+            // would always be block_size, unless it's the last block
+            int size = (job->size - i) > job->block_size ? job->block_size : job->size - i;
+
+            job->success = 1 == EVP_CipherUpdate(ctx, job->out + i, &len, job->in + i, size);
+        }
+    }
+
+    EVP_CIPHER_CTX_free(ctx);
+
+    return NULL;
+}
+
+// number of threads used for size bytes, each thread gets at least MIN_THREAD_SIZE bytes
+long get_threads_count(struct metadata *metadata, long size) {
+
+    long threads = metadata->threads ? metadata->threads : sysconf(_SC_NPROCESSORS_ONLN);
+    long max_threads = size / MIN_THREAD_SIZE + 1;
+
+    if ( threads > max_threads ) threads = max_threads;
+
+    return threads > 0 ? threads : 1;
+}
+
+/* (de)ciphers size bytes of in to out with several threads, each thread gets its own part of the binary
+ * - CTR: the counter of a part is the iv + the number of the first block of the part
+ * - CBC (decryption only): the iv of a part is the last ciphered block of the previous part
+ * returns 0 if a thread failed
+ */
+int cipher_parallel(unsigned char *out, unsigned char *in, long size, unsigned char *key, unsigned char *payload_iv, struct metadata *metadata, int enc) {
+
+    long threads = get_threads_count(metadata, size);
+    long block_size = metadata->block_size ? metadata->block_size : DEFAULT_BLOCK_SIZE;
+    int ctr = metadata->flags & FLAG_CTR;
+    int success = 1;
+
+    // size of each part, rounded to the AES block size
+    long part_size = ((size + threads - 1) / threads + AES_BLOCK_SIZE - 1) & ~((long) AES_BLOCK_SIZE - 1);
+    if ( part_size == 0 ) part_size = AES_BLOCK_SIZE;
+
+    struct cipher_job *jobs = calloc(threads, sizeof(struct cipher_job));
+    if ( jobs == NULL ) handle_error("malloc jobs");
+
+    long jobs_count = 0;
+
+    for ( long start = 0; start < size && jobs_count < threads; start += part_size, jobs_count++ ) {
+
+        struct cipher_job *job = &jobs[jobs_count];
+
+        job->out = out + start;
+        job->in = in + start;
+        job->size = (size - start) > part_size ? part_size : size - start;
+        job->key = key;
+        job->cipher = ctr ? EVP_aes_256_ctr() : EVP_aes_256_cbc();
+        job->enc = enc;
+        job->block_size = block_size;
+
+        if ( ctr )
+            add_counter(job->iv, payload_iv, start / AES_BLOCK_SIZE);
+        else
+            memcpy(job->iv, start ? in + start - AES_BLOCK_SIZE : payload_iv, AES_BLOCK_SIZE);
+    }
+
+    // the last part is (de)ciphered by the current thread, the part is done in the current thread as well if the thread can't be created
+    for ( long i = 0; i < jobs_count; i++ ) {
+        jobs[i].started = i < jobs_count - 1 && pthread_create(&jobs[i].thread, NULL, run_cipher_job, &jobs[i]) == 0;
+        if ( !jobs[i].started ) run_cipher_job(&jobs[i]);
+    }
+
+    for ( long i = 0; i < jobs_count; i++ ) {
+        if ( jobs[i].started ) pthread_join(jobs[i].thread, NULL);
+        success &= jobs[i].success;
+    }
+
+    free(jobs);
 
-    int offset = 0;
-    int decrypt_len, encrypt_len;
-    int block_size = 0;
+    return success;
+}
+
+// size of the ciphered data without padding, the compressed binary if it has been compressed
+unsigned long long get_ciphered_size(struct metadata *metadata) {
+
+    return metadata->compression != COMPRESSION_NONE ? metadata->compressed_size : metadata->payload_size;
+}
+
+// size of the ciphered data on disk, there's always a block of padding
+unsigned long long get_padded_size(struct metadata *metadata) {
+
+    return (get_ciphered_size(metadata) / AES_BLOCK_SIZE + 1) * AES_BLOCK_SIZE;
+}
+
+/* deciphers the ciphered binary (padded size) straight into plaintext (size of the ciphered data without padding)
+ * CBC: every block but the last one is deciphered in parallel, then the last block is deciphered and its padding is checked (wrong key, .text has been modified)
+ * CTR: there's no padding, the header of the deciphered binary is checked instead (the decompression checks a compressed binary)
+ * returns 0 if the key is wrong
+ */
+int decrypt_payload(unsigned char *plaintext, unsigned char *ciphertext, unsigned char *key, unsigned char *payload_iv, struct metadata *metadata) {
+
+    if ( metadata->flags & FLAG_CTR ) {
+        return cipher_parallel(plaintext, ciphertext, get_ciphered_size(metadata), key, payload_iv, metadata, 1)
+            && (metadata->compression != COMPRESSION_NONE || memcmp(plaintext, ELFMAG, SELFMAG) == 0);
+    }
+
+    EVP_CIPHER_CTX *decrypt_ctx;
+
+    long last_block = get_padded_size(metadata) - AES_BLOCK_SIZE;
+    unsigned char last_plaintext[2 * AES_BLOCK_SIZE];
+    int decrypt_len, final_len;
+
+    if ( !cipher_parallel(plaintext, ciphertext, last_block, key, payload_iv, metadata, 0) ) return 0;
+
+    if ( !(decrypt_ctx = EVP_CIPHER_CTX_new()) ) handle_error("can't initiat context");
+
+    if ( 1 != EVP_DecryptInit_ex(decrypt_ctx, EVP_aes_256_cbc(), NULL, key, last_block ? ciphertext + last_block - AES_BLOCK_SIZE : payload_iv)
+        || 1 != EVP_DecryptUpdate(decrypt_ctx, last_plaintext, &decrypt_len, ciphertext + last_block, AES_BLOCK_SIZE))
+        handle_error("crypto update failed");
+
+    int success = EVP_DecryptFinal_ex(decrypt_ctx, last_plaintext + decrypt_len, &final_len) == 1
+        && (unsigned long long) (last_block + decrypt_len + final_len) == get_ciphered_size(metadata);
+
+    if ( success ) memcpy(plaintext + last_block, last_plaintext, decrypt_len + final_len);
+
+    // be nice
+    EVP_CIPHER_CTX_free(decrypt_ctx);
+
+    return success;
+}
+
+/* ciphers the binary with the key of the next run, the ciphered blocks are written in the image of the binary at payload_offset
+ * CTR: in parallel, like the decryption
+ * CBC: each block depends on the previous one, by blocks of block_size bytes in the current thread
+ */
+void encrypt_payload(unsigned char *plaintext, unsigned long long payload_offset, unsigned char *key, struct metadata *metadata) {
+
+    long size = get_ciphered_size(metadata);
+
+    if ( metadata->flags & FLAG_CTR ) {
+        if ( !cipher_parallel((unsigned char *) get_binary_image(payload_offset, size), plaintext, size, key, iv, metadata, 1) )
+            handle_error("crypto update failed");
+        return;
+    }
+
+    EVP_CIPHER_CTX *encrypt_ctx;
+
+    long block_size = metadata->block_size ? metadata->block_size : DEFAULT_BLOCK_SIZE;
+    long encrypted_len = 0;
+    int encrypt_len;
+
+    // +16 bytes, EVP_EncryptUpdate keeps the end of the last block until the next call
+    unsigned char *encrypted = malloc(block_size + AES_BLOCK_SIZE);
+    if ( encrypted == NULL ) handle_error("malloc encryption block");
+
+    if ( !(encrypt_ctx = EVP_CIPHER_CTX_new()) ) handle_error("can't initiat context");
+
+    if ( 1 != EVP_EncryptInit_ex(encrypt_ctx, EVP_aes_256_cbc(), NULL, key, iv)) handle_error("can't init crypto");
+
+    for ( long i = 0; i < size; i += block_size ) {
+
+        int block = (size - i) > block_size ? block_size : size - i;
+
+        if ( 1 != EVP_EncryptUpdate(encrypt_ctx, encrypted, &encrypt_len, plaintext + i, block))
+            handle_error("crypto update failed");
+
+        write_to_binary((char *) encrypted, encrypt_len, payload_offset + encrypted_len);
+        encrypted_len += encrypt_len;
+    }
+
+    if ( 1 != EVP_EncryptFinal_ex(encrypt_ctx, encrypted, &encrypt_len)) handle_error("evp_enrypt_final");
 
-    /* +16 bytes come from EVP_XXcryptUpdate
-     * it writes the 16 last bytes from the last block at the next call
-     * https://security.stackexchange.com/questions/86952/why-does-the-first-call-to-decryptupdate-in-aes-cbc-return-16-fewer-bytes
-     * */
-    unsigned char decrypted[256+16] = {0};
-    unsigned char re_encrypted_text[256+16] = {0};
+    write_to_binary((char *) encrypted, encrypt_len, payload_offset + encrypted_len);
 
-    int decrypted_len, encrypted_len;
-    int size_without_padding = 0;
+    EVP_CIPHER_CTX_free(encrypt_ctx);
+    free(encrypted);
+}
 
+void decrypt(unsigned char *section, int fd_d)
+{
     union SALT salt; // because I'm salted
 
+    struct metadata *metadata = (struct metadata *) section;
+
+    // hash of .text, computed once, every key comes from it
+    unsigned char *text_hash = get_text_hash(metadata);
+
     // key for encryption
     // come from sha256(.text) ^ timestamp
-    unsigned char *key = get_text_hash();
+    unsigned char key[SHA256_DIGEST_LENGTH];
+    memcpy(key, text_hash, SHA256_DIGEST_LENGTH);
 	// new_key is the key when re encrypting the decoded stuff, it's explained later, enjoy the code
 	unsigned char new_key[SHA256_DIGEST_LENGTH] = {0};
 
@@ -55,26 +334,47 @@ void decrypt(unsigned char *ciphertext, int fd_d)
      * +------------------------+------------------------------------+
      * |  timestamp of last run | additionnal section offset on disk |
      * +------------------------+------------------------------------+
+     * | flags, block size, payload size, data iv, wrapped key,      |
+     * | number of threads, compression, compressed size and offset  |
+     * | of the ciphered binary                                      |
+     * +-------------------------------------------------------------+
+     *   ... rest of the packer ...
+     * +-------------------------------------------------------------+ payload_offset
      * | DATAAAAAAAAAAAAAAAAAAAAAAAAAAAAA ...                        |
      * | AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACABAAAAAAAAAAAAA |
      * |  ... AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA |
-     * +-------------------------------------------------------------+
+     * +-------------------------------------------------------------+ end of file
      */
 
-	unsigned long long section_offset_on_disk  = *((unsigned long long *) (ciphertext+8));
+	unsigned long long section_offset_on_disk  = metadata->section_offset;
 
 	if (section_offset_on_disk == 0) handle_error("houston, we got a probleme here");
 
-    if ( *((unsigned long long *) ciphertext) == 0) {
+	// the ciphered binary must be in the file, nothing has been appended if the packer isn't packed
+	if (metadata->payload_offset == 0 || metadata->payload_offset + get_padded_size(metadata) > (unsigned long long) current_binary_size)
+		handle_error("no ciphered binary");
+
+	unsigned char *ciphertext = (unsigned char *) tmp_mapped_binary + metadata->payload_offset;
+
+	// in envelope mode the timestamp and the wrapped key of the last run are in the state next to the binary (the metadata before the first run)
+	struct envelope_state state;
+	int envelope = metadata->flags & FLAG_ENVELOPE;
+
+	if ( envelope ) load_envelope_state(&state, metadata);
+
+	unsigned long long timestamp = envelope ? state.timestamp : metadata->timestamp;
+
+    if ( timestamp == 0) {
 
         // getting the timestamp of the run
         salt._long =  (unsigned long) time(NULL);
 
-        // writing timestamp to metadata
-        write_to_binary(salt._byte, 8, section_offset_on_disk);
+        // writing timestamp to metadata (to the state in envelope mode)
+        if ( envelope ) state.timestamp = salt._long;
+        else write_to_binary(salt._byte, 8, section_offset_on_disk);
 
         // preparing the key for encryption
-		generate_key(new_key, &salt);
+		generate_key(new_key, text_hash, &salt);
 
     }
 
@@ -82,100 +382,80 @@ void decrypt(unsigned char *ciphertext, int fd_d)
     else {
 
         // retrieving the timestamp
-        salt._long = *((unsigned long *) ciphertext);
+        salt._long = timestamp;
 
-        generate_key(key, &salt);
+        generate_key(key, text_hash, &salt);
 
         // preparing the new key
         salt._long = (unsigned long) time(NULL);
-        // writing timestamp to metadata
-        write_to_binary(salt._byte, 8, section_offset_on_disk);
+        // writing timestamp to metadata (to the state in envelope mode)
+        if ( envelope ) state.timestamp = salt._long;
+        else write_to_binary(salt._byte, 8, section_offset_on_disk);
 
 	    // preparing the key for encryption
-	    generate_key(new_key, &salt);
+	    generate_key(new_key, text_hash, &salt);
 
     }
 
-    // we skip our metada
-    ciphertext += 16;
-
-    if ( !(decrypt_ctx = EVP_CIPHER_CTX_new()) || !(encrypt_ctx = EVP_CIPHER_CTX_new()) ) handle_error("can't initiat context");
-
-
-    if ( 1 != EVP_EncryptInit_ex(encrypt_ctx, EVP_aes_256_cbc(), NULL, new_key, iv)
-        || 1 != EVP_DecryptInit_ex(decrypt_ctx, EVP_aes_256_cbc(), NULL, key, iv)) handle_error("can't init crypto");
+    // the anonymous file gets the size of the binary and is mapped, the binary is deciphered straight into it
+    if ( ftruncate(fd_d, metadata->payload_size) == -1 ) handle_error("can't resize anonymous file");
 
-    /* decrypting / encrypting routine */
+    unsigned char *plaintext = mmap(NULL, metadata->payload_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd_d, 0);
+    if ( plaintext == MAP_FAILED ) handle_error("can't map anonymous file");
 
-    /*
-     * encryption / decryption process operate by 256 bytes block
-     * so we count amount of block rounded up. In all case, only the last block could have a different size
-     * or just be equal to 256
+    /* a compressed binary is deciphered in a buffer (size of the compressed binary) then decompressed straight into the anonymous file,
+     * otherwise the binary is deciphered in the anonymous file
      */
-    for( int i = 0; i < (int) ceil(TO_BE_PACKED_SIZE / 256.0); i++ ) {
+    unsigned char *deciphered = plaintext;
 
-    	// would always be 256, unless it's the last block
-        block_size = (TO_BE_PACKED_SIZE - (256 * i)) > 256 ?  256 : (TO_BE_PACKED_SIZE - (256 * i)) % 256 ;
-
-        /*
-         * as explained before, sometimes 16 bytes are added, but only after on call to xxxcrypt_update is made
-         */
-        if (i && !offset)
-            offset = 16;
+    if ( metadata->compression != COMPRESSION_NONE ) {
+        deciphered = malloc(get_ciphered_size(metadata) + AES_BLOCK_SIZE);
+        if ( deciphered == NULL ) handle_error("malloc compressed binary");
+    }
 
-        if ( 1 != EVP_DecryptUpdate(decrypt_ctx, decrypted, &decrypt_len, ciphertext + (256 * i), block_size))
-        	handle_error("crypto update failed");
+    if ( envelope ) {
 
-        decrypted_len += decrypt_len;
+        /* envelope mode, the binary has been ciphered once with a random data key
+         * the data key is unwrapped with the current key, the binary is deciphered in the anonymous file
+         * then the data key is wrapped with the new key, only the state (timestamp and wrapped key) is written next to the binary
+         */
+        unsigned char data_key[SHA256_DIGEST_LENGTH] = {0};
 
+        wrap_key(data_key, state.wrapped_key, key, 0);
 
-        // re encrypting the stuff
-        if(  1 != EVP_EncryptUpdate(encrypt_ctx, re_encrypted_text, &encrypt_len, decrypted + offset, block_size))
-	        handle_error("crypto update failed");
+        // the padding is checked, it fails if the key is wrong (.text has been modified) and the binary isn't saved
+        if ( !decrypt_payload(deciphered, ciphertext, data_key, metadata->data_iv, metadata)) handle_error("evp_decrypt_final");
 
-        encrypted_len += encrypt_len;
+        if ( deciphered != plaintext && !decompress_payload(plaintext, metadata->payload_size, deciphered, get_ciphered_size(metadata), metadata->compression))
+            handle_error("can't decompress binary");
 
-		// i forgot why I added the +16, without it segfault. Better keeping it.
-        unsigned long block_offset = section_offset_on_disk + 16 + (256 * i);
+        // the binary isn't ciphered again, only the data key with the new key
+        wrap_key(state.wrapped_key, data_key, new_key, 1);
+        save_envelope_state(&state);
 
-	    write_to_binary((char *) re_encrypted_text, block_size, block_offset);
+        OPENSSL_cleanse(data_key, sizeof(data_key));
+    }
+    else {
 
-	    // debug, could help
-        // BIO_dump_fp (stdout, (const char *)decrypted + offset, block_size);
-        // puts("");
-        // BIO_dump_fp (stdout, (const char *)ciphertext + (256 * i), block_size);
-        // puts("");
-        // BIO_dump_fp (stdout, re_encrypted_text, block_size);
-        // puts("");
+        if ( !decrypt_payload(deciphered, ciphertext, key, iv, metadata)) handle_error("evp_decrypt_final");
 
-		// PKCS padding, the last byte of decrypted data is the size in byte of padding
-        size_without_padding = block_size - ((block_size != 256) ? ((int) decrypted[block_size + 8 - 1]) : 0);
+        // the binary is decompressed before it's saved, nothing is written if the compressed binary is corrupted
+        if ( deciphered != plaintext && !decompress_payload(plaintext, metadata->payload_size, deciphered, get_ciphered_size(metadata), metadata->compression))
+            handle_error("can't decompress binary");
 
-        // writing the part of the ELF to our anonymous file
-        write(fd_d, decrypted + offset, size_without_padding);
+        // re encrypting the stuff with the key of the next run, the compressed binary is ciphered again as is
+        encrypt_payload(deciphered, metadata->payload_offset, new_key, metadata);
     }
 
-    save_binary();
-
-    if ( 1 != EVP_DecryptFinal_ex(decrypt_ctx, decrypted + decrypt_len, &decrypt_len)) {
-	    #ifdef DEBUG
-	        puts("evp_decrypt_final");
-	    #endif
-    }
-    else {
-        decrypted_len += decrypt_len;
+    if ( deciphered != plaintext ) {
+        OPENSSL_cleanse(deciphered, get_ciphered_size(metadata));
+        free(deciphered);
     }
 
-    if(1 != EVP_EncryptFinal_ex(encrypt_ctx, re_encrypted_text + encrypt_len, &encrypt_len)) {
-	    #ifdef DEBUG
-	        puts("evp_enrypt_final");
-	    #endif
+    if ( munmap(plaintext, metadata->payload_size) == -1 ) handle_error("can't unmap anonymous file");
 
-    } else {
-        encrypted_len += encrypt_len;
-    }
+    save_binary();
 
-    // be nice
-    EVP_CIPHER_CTX_free(decrypt_ctx);
-    EVP_CIPHER_CTX_free(encrypt_ctx);
+    OPENSSL_cleanse(key, sizeof(key));
+    free(text_hash);
 }
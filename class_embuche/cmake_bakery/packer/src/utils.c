@@ -1,7 +1,12 @@
+#define _GNU_SOURCE
+#include <stdio.h>
 #include <string.h>
+#include <limits.h>
 #include <fcntl.h>
 #include <unistd.h>
 #include <sys/stat.h>
+#include <sys/ioctl.h>
+#include <linux/fs.h>
 
 #include <openssl/sha.h>
 
@@ -9,12 +14,16 @@
 #include "cryptage.h"
 #include <stdlib.h>
 
-unsigned char * get_text_hash() {
+// hash of .text, sha256 or tree hash (FLAG_TREE_HASH), it's computed once per run and every key is derived from it
+unsigned char * get_text_hash(struct metadata *metadata) {
 
-    unsigned char *hash = malloc(SHA224_DIGEST_LENGTH);
+    unsigned char *hash = malloc(SHA256_DIGEST_LENGTH);
     if( hash == NULL) handle_error(".text hash malloc");
 
-    do_sha256(hash, (unsigned char *) &text_addr, (long) &text_size);
+    if ( metadata->flags & FLAG_TREE_HASH )
+        tree_hash(hash, (unsigned char *) &text_addr, (long) &text_size, metadata->tree_chunk_size, metadata);
+    else
+        do_sha256(hash, (unsigned char *) &text_addr, (long) &text_size);
 
     return hash;
 }
@@ -25,12 +34,12 @@ void preparing_timestamp(union SALT *salt) {
 		salt->_byte[i + 4] = salt->_byte[i];
 }
 
-void generate_key(unsigned char *new_key, union SALT *salt) {
+void generate_key(unsigned char *new_key, unsigned char *text_hash, union SALT *salt) {
 	// preparing the key for encryption
 
 	preparing_timestamp(salt);
-	// getting the .text section hash, as key for encryption
-	do_sha256(new_key, (unsigned char *) &text_addr, (long) &text_size);
+	// the .text section hash, as key for encryption
+	memcpy(new_key, text_hash, SHA256_DIGEST_LENGTH);
 
 	// Xoring with timestamp
 	for ( int i = 0; i < SHA256_DIGEST_LENGTH; i++) {
@@ -39,34 +48,132 @@ void generate_key(unsigned char *new_key, union SALT *salt) {
 }
 
 
+// part of the image modified since the start, only these bytes are written on disk
+static unsigned long dirty_start = ULONG_MAX;
+static unsigned long dirty_end = 0;
+
+// copy the content of the binary to out, without reading it in user space
+int clone_binary(int in, int out) {
+
+	// reflink, no data is copied if the filesystem supports it (btrfs, xfs)
+	if (ioctl(out, FICLONE, in) == 0)
+		return 0;
+
+	// copy in the kernel otherwise
+	loff_t in_offset = 0;
+	while (in_offset < current_binary_size) {
+		ssize_t copied = copy_file_range(in, &in_offset, out, NULL, current_binary_size - in_offset, 0);
+		if (copied <= 0)
+			return -1;
+	}
+
+	return 0;
+}
+
 void save_binary (void) {
 
 	/*
 	 * As we can't write change directly to the binary as the file has a lock on it from another process which seems to be the loadder,
-	 * we just remove it (yeah it's sucks) and write the (modified) image of the binary we maintain in ram
+	 * we create a copy of it next to it (a clone when possible), write only the modified bytes of the image we maintain in ram
+	 * in the copy and replace the binary with it
 	 * */
 
+	if (current_binary_name && NULL != tmp_mapped_binary && dirty_end > dirty_start) {
+		char tmp_name[PATH_MAX];
+		struct stat st;
+
+		if (snprintf(tmp_name, PATH_MAX, "%s.XXXXXX", current_binary_name) >= PATH_MAX) handle_error("binary name too long");
+
+		int in = open(current_binary_name, O_RDONLY);
+		int out = mkstemp(tmp_name);
 
-	if (current_binary_name) {
-		if (-1 == unlink(current_binary_name)) handle_error("couldn't remote ourself :(");
+		if (in == -1 || out == -1 || fstat(in, &st) == -1) handle_error("cannot write to binary");
 
-		int out = open(current_binary_name, O_CREAT | O_TRUNC | O_RDWR, S_IRWXU);
+		// the whole image is written if the binary can't be cloned
+		if (clone_binary(in, out) == -1) {
+			dirty_start = 0;
+			dirty_end = current_binary_size;
+		}
 
-		if (NULL != tmp_mapped_binary && out) {
-			write(out, tmp_mapped_binary, current_binary_size);
-			close(out);
-		} else
+		if (pwrite(out, (char *) tmp_mapped_binary + dirty_start, dirty_end - dirty_start, dirty_start) != (ssize_t) (dirty_end - dirty_start)
+			|| fchmod(out, st.st_mode & 07777) == -1)
 			handle_error("cannot write to binary");
 
+		close(in);
+		close(out);
+
+		if (-1 == rename(tmp_name, current_binary_name)) handle_error("couldn't replace ourself :(");
+	}
+}
+
+// path of the state of the envelope mode, next to the binary
+static int get_envelope_path(char *path) {
+
+	return snprintf(path, PATH_MAX, "%s" ENVELOPE_SUFFIX, current_binary_name) < PATH_MAX;
+}
+
+// state of the last run in envelope mode, from the file next to the binary if it belongs to this packing, from the metadata otherwise (first run)
+void load_envelope_state(struct envelope_state *state, struct metadata *metadata) {
+
+	char path[PATH_MAX];
+
+	if (get_envelope_path(path)) {
+		int fd = open(path, O_RDONLY);
+
+		if (fd != -1) {
+			ssize_t size = read(fd, state, sizeof(struct envelope_state));
+			close(fd);
+
+			if (size == sizeof(struct envelope_state) && memcmp(state->data_iv, metadata->data_iv, sizeof(state->data_iv)) == 0)
+				return;
+		}
 	}
+
+	memcpy(state->data_iv, metadata->data_iv, sizeof(state->data_iv));
+	state->timestamp = metadata->timestamp;
+	memcpy(state->wrapped_key, metadata->wrapped_key, sizeof(state->wrapped_key));
+}
+
+/* the binary is never rewritten in envelope mode, only the state (timestamp and wrapped key) is written next to it,
+ * in a copy renamed over the previous state so a run never reads half a state
+ * */
+void save_envelope_state(struct envelope_state *state) {
+
+	char path[PATH_MAX];
+	char tmp_name[PATH_MAX];
+	struct stat st;
+
+	if (!get_envelope_path(path) || snprintf(tmp_name, PATH_MAX, "%s.XXXXXX", path) >= PATH_MAX) handle_error("binary name too long");
+
+	int out = mkstemp(tmp_name);
+	if (out == -1) handle_error("cannot write envelope state");
+
+	// the state gets the permissions of the binary without the execution bits
+	if (write(out, state, sizeof(struct envelope_state)) != sizeof(struct envelope_state)
+		|| (stat(current_binary_name, &st) == 0 && fchmod(out, st.st_mode & 0666) == -1))
+		handle_error("cannot write envelope state");
+
+	close(out);
+
+	if (-1 == rename(tmp_name, path)) handle_error("couldn't save envelope state");
+}
+
+// return the address of a part of the mapped image of the binary that is going to be modified, save_binary writes it on disk
+char * get_binary_image(unsigned long offset, long size) {
+
+  if (offset < dirty_start) dirty_start = offset;
+  if (offset + size > dirty_end) dirty_end = offset + size;
+
+  return (char *)tmp_mapped_binary + offset;
+
 }
 
-// write stuff to the binary image mapped in the heap then save it
+// write stuff to the mapped image of the binary, save_binary writes it on disk
 void write_to_binary(char *what, int size, unsigned long offset) {
 
   if (current_binary_name) {
 
-      memcpy((char *)tmp_mapped_binary + offset, what, size);
+      memcpy(get_binary_image(offset, size), what, size);
 
   }
 
@@ -10,11 +10,11 @@
 #include "cryptage.h"
 
 
-char surprise_section[REAL_SIZE] __attribute__ ((section (".fini."))) = { 0 };
+char surprise_section[METADATA_SIZE] __attribute__ ((section (".fini."))) = { 0 };
 unsigned char *iv = (unsigned char *)"0123456789012345";
 
 char *current_binary_name;  // store the actual binary path and name
-void *tmp_mapped_binary;    // address in heap where is store the image of the binary
+void *tmp_mapped_binary;    // address where the image of the binary is mapped (private mapping, changes aren't written to the file)
 int current_binary_size;    // size of the binary to be packed
 
 
@@ -37,16 +37,14 @@ int main(int argc, char** argv, char **env) {
     int fd = open(current_binary_name, O_RDONLY);
     if (fd == -1 ) handle_error("fd on packer -1");
 
-    // get file size and reset cursor at the benining
+    // get file size
     current_binary_size = lseek(fd, 0 , SEEK_END);
-    lseek(fd, 0, SEEK_SET);
 
-    // we gonna map the packer itself in the ram
-    tmp_mapped_binary = malloc(current_binary_size);
-    if (tmp_mapped_binary == NULL ) handle_error("malloc packer memory mapping");
+    // we gonna map the packer itself in the ram, only the pages modified by write_to_binary are copied
+    tmp_mapped_binary = mmap(NULL, current_binary_size, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+    if (tmp_mapped_binary == MAP_FAILED ) handle_error("can't map binary in memory");
 
-    if ( read(fd, tmp_mapped_binary, current_binary_size) != current_binary_size)
-    	handle_error("can't map binary in memory");
+    close(fd);
 
     // creating an anonymous file in ram
     int fd_d = memfd_create(anon_fd_name, MFD_CLOEXEC);
@@ -56,7 +54,7 @@ int main(int argc, char** argv, char **env) {
     snprintf(fname, 1024, "/proc/%d/fd/%d", getpid(), fd_d);
     argv[0] = fname;
 
-    // we decrypt the encrypted section, which is stored at *stack
+    // we decrypt the binary appended to the packer, its size and offset are in the metadata of the .fini. section
     decrypt((unsigned char *) surprise_section, fd_d);
     execve(fname, argv, env);
 
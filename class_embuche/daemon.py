@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import signal
+import tempfile
+import threading
+import traceback
+import socketserver
+import importlib.util
+from .embuche import embuche
+from .cmake_bakery.cmake_bakery import get_template_environment
+from .packer_stub import PACKER_SCRIPT
+from .daemon_client import DAEMON_VARIABLE
+from . import tracer
+
+# Scripts executed by the daemon (name given by the client: path), they're imported once when the daemon starts
+SCRIPTS = {
+    'elf_passes.py': os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cmake_bakery', 'hellf_scripts', 'elf_passes.py'),
+    'packer.py': PACKER_SCRIPT
+}
+
+def load_script(path):
+    # Import a script of Embuche as a module, its directory is added to the path for the modules next to it (Hellf passes)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+    spec = importlib.util.spec_from_file_location('embuche_' + os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+def run_forked(function, cwd, environment):
+    # Execute function in a child forked from the daemon, the modules are already loaded and the job can't change the state of the daemon,
+    # return the exit status of the job and its output (stdout and stderr)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    with tempfile.TemporaryFile() as output:
+        pid = os.fork()
+
+        if pid == 0:
+            status = 1
+            try:
+                os.dup2(output.fileno(), 1)
+                os.dup2(output.fileno(), 2)
+                os.chdir(cwd)
+
+                for variable, value in environment.items():
+                    if value is None:
+                        os.environ.pop(variable, None)
+                    else:
+                        os.environ[variable] = value
+
+                function()
+                status = 0
+            except SystemExit as error:
+                status = error.code if isinstance(error.code, int) else int(error.code is not None)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        output.seek(0)
+
+        return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1, output.read().decode(errors='replace')
+
+class embuche_daemon():
+    def __init__(self, socket_path, workers, cache=None):
+        self.__socket_path = os.path.abspath(socket_path)
+        self.__cache = cache
+        # The builds and the scripts have their own workers, a build waiting for its scripts (CMake, variants) never takes the worker of a script
+        self.__builds = threading.BoundedSemaphore(workers)
+        self.__scripts = threading.BoundedSemaphore(workers)
+        self.__workers = workers
+        # Load the templates and the scripts before the first job
+        self.__load()
+
+    def __load(self):
+        # Parse every template in the shared Jinja environment and import the scripts (Hellf, pycryptodome)
+        template_environment = get_template_environment()
+        for template in template_environment.list_templates():
+            template_environment.get_template(template)
+
+        self.__modules = {name: load_script(path) for name, path in SCRIPTS.items()}
+
+    def __build(self, message):
+        # Build a project like embuche.py config_file
+        def build():
+            project = embuche(message['config_file'], self.__cache, message.get('clean', False), message.get('jobs'))
+            project.prepare_cmake()
+            project.run()
+
+        with self.__builds:
+            return run_forked(build, message['cwd'], message.get('environment', {}))
+
+    def __script(self, message):
+        # Execute a script (elf_passes.py, packer.py) with the arguments of the client
+        module = self.__modules[message['script']]
+
+        def script():
+            sys.argv = [SCRIPTS[message['script']]] + message['arguments']
+            module.main(message['arguments'])
+
+        with self.__scripts:
+            return run_forked(script, message['cwd'], message.get('environment', {}))
+
+    def handle(self, message):
+        # Execute the job of a request, return the response sent to the client (exit status and output)
+        if message.get('command') == 'build':
+            status, output = self.__build(message)
+        elif message.get('command') == 'script' and message.get('script') in self.__modules:
+            status, output = self.__script(message)
+        else:
+            # The client executes the unknown scripts itself
+            status, output = None, '[-] Unknown job : {}\n'.format(message.get('script', message.get('command')))
+
+        return {'status': status, 'output': output}
+
+    def serve(self):
+        # Accept the jobs on the socket until SIGTERM or Ctrl-C
+        daemon = self
+
+        class request_handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    message = json.loads(self.rfile.readline())
+                except ValueError:
+                    return
+
+                self.wfile.write(json.dumps(daemon.handle(message)).encode() + b'\n')
+
+        if os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+
+        # The builds started by the daemon (and their CMake) call it back through the client
+        os.environ[DAEMON_VARIABLE] = self.__socket_path
+        # The trace of a job is given by its client
+        os.environ.pop(tracer.TRACE_VARIABLE, None)
+
+        server = socketserver.ThreadingUnixStreamServer(self.__socket_path, request_handler)
+        server.daemon_threads = True
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        print('[+] Embuche daemon listening on {} ({} worker(s))'.format(self.__socket_path, self.__workers))
+        sys.stdout.flush()
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(self.__socket_path)
+            print('[+] Embuche daemon stopped')
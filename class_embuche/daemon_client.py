@@ -0,0 +1,125 @@
+#!/usr/bin/python3.8
+# coding: utf-8
+# Thin client of the daemon of Embuche (embuche.py serve), it only uses the standard library so it starts quickly with python3.8 -S
+# (without the site module, sys.exit is used instead of exit)
+# python3.8 -S daemon_client.py script.py [arguments]: the script is executed by the daemon, or by a new interpreter if the daemon can't be reached
+# python3.8 -S daemon_client.py build config_file [...] [--clean] [-j N]: the projects are built by the daemon
+import os
+import sys
+import json
+import socket
+import argparse
+import subprocess
+
+# Path of the socket of the daemon, the daemon sets it for the builds and the scripts executed by CMake
+DAEMON_VARIABLE = 'EMBUCHE_DAEMON'
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), 'embuche-{}.sock'.format(os.getuid()))
+# Variables of the client given to the jobs of the daemon (trace of the build)
+FORWARDED_VARIABLES = ['EMBUCHE_TRACE']
+
+def request(socket_path, message):
+    # Send a request (one JSON line) to the daemon and return its response: the exit status and the output of the job
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(message).encode() + b'\n')
+
+        with client.makefile('rb') as response:
+            line = response.readline()
+
+    if not line:
+        raise ConnectionError('the daemon closed the connection')
+
+    return json.loads(line)
+
+def get_environment():
+    # Return the variables of the client given to the job
+    return {variable: os.environ.get(variable) for variable in FORWARDED_VARIABLES}
+
+def request_script(socket_path, script, arguments):
+    # Execute a script of Embuche (elf_passes.py, packer.py) in the daemon
+    return request(socket_path, {
+        'command': 'script',
+        'script': os.path.basename(script),
+        'arguments': arguments,
+        'cwd': os.getcwd(),
+        'environment': get_environment()
+    })
+
+def request_build(socket_path, config_file, clean=False, jobs=None):
+    # Build a project in the daemon
+    return request(socket_path, {
+        'command': 'build',
+        'config_file': os.path.abspath(config_file),
+        'clean': clean,
+        'jobs': jobs,
+        'cwd': os.getcwd(),
+        'environment': get_environment()
+    })
+
+def run_script(script, arguments, log=None):
+    # Execute a script of Embuche with its arguments in the daemon if EMBUCHE_DAEMON is set, in a new interpreter otherwise,
+    # the output is written to log (stdout if None), raise CalledProcessError if the script failed
+    socket_path = os.environ.get(DAEMON_VARIABLE)
+
+    if socket_path:
+        try:
+            response = request_script(socket_path, script, arguments)
+        except (OSError, ValueError):
+            response = None
+
+        # The daemon doesn't execute the scripts it doesn't know (status None)
+        if response is not None and response['status'] is not None:
+            target = log if log is not None else sys.stdout
+            target.write(response['output'])
+            target.flush()
+
+            if response['status'] != 0:
+                raise subprocess.CalledProcessError(response['status'], [script] + arguments)
+            return
+
+    subprocess.run(['python3.8', script] + arguments, stdout=log, stderr=log, check=True)
+
+def main(arguments):
+    if arguments[:1] == ['build']:
+        parser = argparse.ArgumentParser(prog='daemon_client.py build', description='Build projects with the daemon of Embuche.')
+        parser.add_argument('config_file', type=str, nargs='+', help='Config files of the projects, they\'re built one after the other.')
+        parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of compilation jobs of each project, overrides the config file.')
+        parser.add_argument('--clean', action='store_true', help='Remove the build directory of the project(s) before building.')
+        parser.add_argument('--socket', type=str, default=os.environ.get(DAEMON_VARIABLE, DEFAULT_SOCKET), help='Socket of the daemon (default: %(default)s).')
+        args = parser.parse_args(arguments[1:])
+
+        status = 0
+        for config_file in args.config_file:
+            try:
+                response = request_build(args.socket, config_file, args.clean, args.jobs)
+            except (OSError, ValueError) as error:
+                print('[-] Can\'t reach the daemon of Embuche on {} : {}'.format(args.socket, error))
+                sys.exit(1)
+
+            sys.stdout.write(response['output'])
+            status = max(status, response['status'])
+
+        sys.exit(status)
+
+    if len(arguments) == 0:
+        print('Usage: daemon_client.py script.py [arguments] | daemon_client.py build config_file [...]')
+        sys.exit(1)
+
+    socket_path = os.environ.get(DAEMON_VARIABLE)
+
+    if socket_path:
+        try:
+            response = request_script(socket_path, arguments[0], arguments[1:])
+        except (OSError, ValueError):
+            response = None
+
+        if response is not None and response['status'] is not None:
+            sys.stdout.write(response['output'])
+            sys.stdout.flush()
+            sys.exit(response['status'])
+
+    # No daemon, the script is executed by a new interpreter
+    os.execvp('python3.8', ['python3.8', arguments[0]] + arguments[1:])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import shlex
+import shutil
+import filecmp
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from .cmake_bakery.cmake_bakery import get_compiler, get_c_flags, LTO_C_FLAGS, LTO_LINKER_FLAGS, PGO_C_FLAGS
+from .daemon_client import run_script
+from . import tracer
+
+# Commands of the last build of a build directory (objects, link and file format hacks), a step is executed again when its command changed
+STATE_FILE = 'direct_build.json'
+
+def read_dependencies(dependency_file):
+    # Return the files an object depends on from the dependency file written by the compiler (-MD), None if it doesn't exist
+    try:
+        with open(dependency_file, 'r') as target:
+            content = target.read().replace('\\\n', ' ')
+    except FileNotFoundError:
+        return None
+
+    # target: dependency dependency ... (spaces in the paths are escaped)
+    files = re.split(r'(?<!\\)\s+', content.split(': ', 1)[1].strip()) if ': ' in content else []
+    return [file.replace('\\ ', ' ') for file in files if file]
+
+def is_outdated(output, dependencies):
+    # Return True if output doesn't exist or is older than one of its dependencies
+    if dependencies is None or not os.path.exists(output):
+        return True
+
+    output_time = os.path.getmtime(output)
+    for dependency in dependencies:
+        if not os.path.exists(dependency) or os.path.getmtime(dependency) > output_time:
+            return True
+
+    return False
+
+class direct_build():
+    def __init__(self, project_path, project_name, conf, file_format_passes, hellf_script_path, toolbox_objects=None):
+        # Compile and link the project with the compiler, without CMake: the commands are the ones of the Makefile CMake
+        # generates from CMakeLists_embuche.txt.Jinja (same flags, same objects), the binary is the same
+        self.__project_path = project_path
+        self.__project_name = project_name
+        self.__compilation_options = conf['options']['compilation_options']
+        self.__files = conf['files']
+        self.__file_format_passes = file_format_passes
+        self.__hellf_script_path = hellf_script_path
+        # Objects of the C toolbox compiled once for the flags of the project (source: object), linked instead of compiling the sources
+        self.__toolbox_objects = toolbox_objects if toolbox_objects is not None else {}
+
+    def get_sources(self, toolbox=True):
+        # Return the sources of the project relative to the project directory and the objects of the toolbox linked with them,
+        # in the order of add_executable (the sources of the toolbox are compiled with the project if toolbox is False)
+        files = [file for file in self.__files if not toolbox or file not in self.__toolbox_objects]
+        objects = [self.__toolbox_objects[file] for file in self.__files if toolbox and file in self.__toolbox_objects]
+
+        return ['src/' + self.__project_name + '.c'] + ['src/' + file for file in files], objects
+
+    def get_flags(self, lto=True, pgo=None, profile_directory=None):
+        # Return the flags of the compiler and of the linker (lists), like CMAKE_C_FLAGS and CMAKE_EXE_LINKER_FLAGS in the CMake file
+        c_flags = get_c_flags(self.__compilation_options)
+        linker_flags = ''
+
+        if self.__compilation_options['lto']['value'] is True and lto:
+            c_flags += ' ' + LTO_C_FLAGS
+            linker_flags += ' ' + LTO_LINKER_FLAGS
+
+        if self.__compilation_options['pgo']['value'] is True:
+            c_flags += ' ' + PGO_C_FLAGS[pgo if pgo is not None else 'use'].format(profile_directory)
+
+        return shlex.split(c_flags), shlex.split(linker_flags)
+
+    def get_compile_command(self, source, c_flags):
+        # Return the object of a source and the command compiling it in the build directory, with its dependency file
+        obj = 'CMakeFiles/{}.dir/{}.o'.format(self.__project_name, source)
+
+        return obj, [get_compiler(self.__compilation_options)] + c_flags + ['-MD', '-MT', obj, '-MF', obj + '.d', '-o', obj, '-c', os.path.join(self.__project_path, source)]
+
+    def __log(self, message, log=None):
+        # Write the progress of the build in the log (stdout if None)
+        if log is not None:
+            log.write(message + '\n')
+            log.flush()
+        else:
+            print(message, flush=True)
+
+    def __read_state(self, build_directory):
+        # Return the commands of the last build (nothing built yet if there's no state)
+        try:
+            with open(os.path.join(build_directory, STATE_FILE), 'r') as target:
+                return json.load(target)
+        except (FileNotFoundError, ValueError):
+            return {'objects': {}, 'link': None, 'protected': None}
+
+    def __write_state(self, build_directory, state):
+        # Save the commands of the steps done, a step interrupted by an error is executed again by the next build
+        with open(os.path.join(build_directory, STATE_FILE), 'w') as target:
+            json.dump(state, target, indent=4)
+
+    def __compile(self, build_directory, commands, jobs, log=None):
+        # Compile the sources in parallel, return the objects compiled
+        def compile(obj):
+            os.makedirs(os.path.dirname(os.path.join(build_directory, obj)), exist_ok=True)
+            self.__log('Building C object {}'.format(obj), log)
+
+            with tracer.stage('direct_compile', 'direct', object=obj):
+                subprocess.run(commands[obj], cwd=build_directory, stdout=log, stderr=log, check=True)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for future in [executor.submit(compile, obj) for obj in commands]:
+                future.result()
+
+        return list(commands)
+
+    def build(self, build_directory, jobs, lto=True, pgo=None, profile_directory=None, post_link=True, log=None):
+        # Compile the modified sources, link the binary in build_directory, then apply the file format hacks on a copy (.protected) and
+        # copy it to bin/ (post_link), each step is only executed again if its command or its inputs changed
+        # pgo is the step of the profile guided optimization (generate or use) and profile_directory the directory of the profile
+        os.makedirs(build_directory, exist_ok=True)
+        state = self.__read_state(build_directory)
+        c_flags, linker_flags = self.get_flags(lto, pgo, profile_directory)
+        # The objects of the toolbox are compiled with -flto if LTO is set, the reference without LTO compiles the sources of the toolbox
+        sources, toolbox_objects = self.get_sources(lto or self.__compilation_options['lto']['value'] is not True)
+
+        # The objects whose command changed, which don't exist or are older than a dependency are compiled again
+        commands = {}
+        objects = []
+        for source in sources:
+            obj, command = self.get_compile_command(source, c_flags)
+            objects.append(obj)
+
+            dependencies = read_dependencies(os.path.join(build_directory, obj + '.d'))
+            if state['objects'].get(obj) != command or is_outdated(os.path.join(build_directory, obj), dependencies):
+                commands[obj] = command
+
+        compiled = self.__compile(build_directory, commands, jobs, log)
+        for obj in compiled:
+            state['objects'][obj] = commands[obj]
+        self.__write_state(build_directory, state)
+
+        binary = os.path.join(build_directory, self.__project_name)
+        link = [get_compiler(self.__compilation_options)] + c_flags + linker_flags + ['-rdynamic'] + objects + toolbox_objects + ['-o', self.__project_name]
+        relinked = False
+
+        if compiled or state['link'] != link or is_outdated(binary, [os.path.join(build_directory, obj) for obj in objects] + toolbox_objects):
+            self.__log('Linking C executable {}'.format(self.__project_name), log)
+
+            with tracer.stage('direct_link', 'direct'):
+                subprocess.run(link, cwd=build_directory, stdout=log, stderr=log, check=True)
+
+            state['link'] = link
+            state['protected'] = None
+            self.__write_state(build_directory, state)
+            relinked = True
+
+        if post_link:
+            self.__post_link(build_directory, binary, relinked, state, log)
+
+    def __post_link(self, build_directory, binary, relinked, state, log=None):
+        # Apply the file format hacks on a copy of the linked binary, they're only applied again when the binary is relinked or the passes changed,
+        # then copy the binary in bin/ (like the custom command and the custom target of fragments/file_format.Jinja)
+        protected = binary + '.protected'
+
+        if relinked or state['protected'] != self.__file_format_passes or not os.path.exists(protected):
+            shutil.copy(binary, protected)
+
+            if self.__file_format_passes:
+                self.__log('Generating {}.protected'.format(self.__project_name), log)
+
+                with tracer.stage('file_format', 'direct', passes=self.__file_format_passes):
+                    run_script(self.__hellf_script_path + '/elf_passes.py', [protected] + self.__file_format_passes, log)
+
+            state['protected'] = self.__file_format_passes
+            self.__write_state(build_directory, state)
+
+        output = os.path.join(self.__project_path, 'bin', self.__project_name)
+        if not os.path.exists(output) or not filecmp.cmp(protected, output, shallow=False):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            shutil.copy(protected, output)
@@ -4,10 +4,24 @@ import shutil
 import yaml
 import subprocess
 import glob
-from .cmake_bakery.cmake_bakery import cmake_bakery
+import json
+import filecmp
+import tarfile
+import copy
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .cmake_bakery.cmake_bakery import cmake_bakery, get_compiler, get_c_flags, get_file_format_passes, LTO_C_FLAGS
+from .artifact_cache import compute_key, hash_file
+from .variants import get_seed, build_variant, pack_binary
+from .packer_stub import get_stub, PACKER_DIRECTORY, PACKER_SCRIPT
+from .direct_build import direct_build, STATE_FILE
+from .toolbox_objects import get_toolbox_sources, get_toolbox_objects, build_toolbox_objects
+from .section_report import print_size_report
+from . import tracer
 
 class embuche():
-    def __init__(self, config_file):
+    def __init__(self, config_file, cache=None, clean=False, jobs=None):
         # Supported Embuche options
         self.__supported_options = {
             'compilation_options': {
@@ -16,6 +30,8 @@ class embuche():
                                     'optimize': { 'value': False, 'flag': 'O3'},
                                     'unroll_loops': { 'value': False, 'flag': 'funroll-all-loops'},
                                     'static': { 'value': False, 'flag': 'static'},
+                                    'pgo': { 'value': False, 'flag': 'fprofile-use', 'training': ''},
+                                    'lto': { 'value': False, 'flag': 'flto'},
                                     'custom': { 'value': [], 'flag': ''}
                                     },
             'file_format': {
@@ -27,10 +43,22 @@ class embuche():
             },
             'packer': {
                 'packer': { 'value': False },
-                'packer_embuche': { 'value': False } }
+                'packer_embuche': { 'value': False },
+                'envelope': { 'value': False },
+                'block_size': { 'value': 1048576 },
+                'mode': { 'value': 'cbc' },
+                'threads': { 'value': 0 },
+                'compression': { 'value': 'none' },
+                'compression_level': { 'value': 6 },
+                'key_derivation': { 'value': 'sha256' } },
+            'build': {
+                'jobs': { 'value': None },
+                'ninja': { 'value': False },
+                'backend': { 'value': 'cmake' } }
             }
         # Set config file with Embuche options (yaml)
-        self.__set_conf(config_file)
+        with tracer.stage('set_conf', config_file=config_file):
+            self.__set_conf(config_file)
 
         # Set path to main code to compile
         self.__set_source_code()
@@ -39,12 +67,31 @@ class embuche():
         # Set the name of the project (name of the main source file)
         self.__set_project_name()
         # Check if config file is ok
-        self.__parse_config()
-        # Prepare directories
-        self.__prepare_directories()
+        with tracer.stage('parse_config'):
+            self.__parse_config()
+        # Number of jobs given in command line overrides the one of the config file
+        if jobs is not None:
+            self.get_conf()['options']['build']['jobs']['value'] = jobs
+        # Objects of the C toolbox shared by the projects compiled with the same flags
+        with tracer.stage('toolbox_objects'):
+            self.__set_toolbox(cache)
         # Prepare CMake for compilation
-        self.__cmake_bakery_embuche = cmake_bakery(self.get_project_directory(), self.get_project_name(), self.get_conf(), 'CMakeLists_embuche.txt.Jinja')
-        self.__cmake_bakery_packer = cmake_bakery(self.get_project_directory() + '/packer', self.get_project_name(), self.get_conf(), 'CMakeLists_packer.txt.Jinja')
+        with tracer.stage('render_cmakelists_embuche'):
+            self.__cmake_bakery_embuche = cmake_bakery(self.get_project_directory(), self.get_project_name(), self.get_conf(), 'CMakeLists_embuche.txt.Jinja', self.__toolbox['objects'])
+        with tracer.stage('render_cmakelists_packer'):
+            self.__cmake_bakery_packer = cmake_bakery(PACKER_DIRECTORY, self.get_project_name(), self.get_conf(), 'CMakeLists_packer.txt.Jinja')
+        # The direct backend executes the commands of the CMake file without CMake
+        self.__direct_build = direct_build(self.get_project_directory(), self.get_project_name(), self.get_conf(), self.__cmake_bakery_embuche.get_template_dict()['file_format_passes'], self.__cmake_bakery_embuche.get_template_dict()['hellf_script_path'], self.__toolbox['objects'])
+        # CMake configure step is needed until the CMake files are prepared
+        self.__configure = True
+        # Restore the binary if the same build is in the cache (artifact_cache object or None)
+        with tracer.stage('cache_lookup'):
+            self.__set_cache(cache)
+        # Prepare directories, not needed if the binary comes from the cache
+        # The build directory is kept between runs (incremental build) unless clean is True
+        if not self.is_restored_from_cache():
+            with tracer.stage('prepare_directories'):
+                self.__prepare_directories(clean)
 
     def __set_conf(self, config_file):
         # Try to load yaml in config file, exit otherwise
@@ -66,6 +113,14 @@ class embuche():
             # Create empty list if no external files, avoid error later
             if 'files' not in self.__conf:
                 self.__conf['files'] = []
+
+            # Build a single binary if no variants
+            if 'variants' not in self.__conf:
+                self.__conf['variants'] = 1
+
+            # No matrix of options
+            if 'matrix' not in self.__conf:
+                self.__conf['matrix'] = {}
         except Exception as e:
             print("[-] Error in config file: {}".format(config_file))
             exit(1)
@@ -134,6 +189,21 @@ class embuche():
                 if compilation_options[option]['value'] is True:
                     set_options.append(self.__supported_options['compilation_options'][option]['flag'])
 
+        # The training command is needed to collect the profile, exit otherwise
+        if 'pgo' in compilation_options:
+            if type(compilation_options['pgo'].get('training')) is not str or compilation_options['pgo']['training'].strip() == '':
+                if compilation_options['pgo']['value'] is True:
+                    print('[-] A training command must be set to use pgo.')
+                    exit(1)
+
+                compilation_options['pgo']['training'] = ''
+
+            if compilation_options['pgo']['value'] is True:
+                set_options += ['fprofile-generate', 'fprofile-dir']
+
+        if 'lto' in compilation_options and compilation_options['lto']['value'] is True:
+            set_options += ['ffunction-sections', 'fdata-sections', 'Wl,--gc-sections']
+
         # Check if there's no duplicate GCC flags with the custom flags
         if 'custom' in compilation_options:
             for flag in compilation_options['custom']['value']:
@@ -176,14 +246,44 @@ class embuche():
                 exit(1)
 
     def __parse_packer(self, packer):
-        # Check if packer is well configured (True or false value)
+        # Check if packer is well configured (True or false value, size of the blocks)
         for option in packer:
             # If option doesn't exists in Embuche, exit
             if option not in self.__supported_options['packer'].keys():
                 print("[-] Unsupported packer options: {}".format(option))
                 exit(1)
+            # If block_size is not a positive multiple of 16, use the default one
+            if option == 'block_size':
+                if type(packer[option]['value']) is not int or packer[option]['value'] <= 0 or packer[option]['value'] % 16 != 0 or packer[option]['value'] >= 2 ** 31:
+                    print("[-] Invalid value for packer block_size, must be a positive multiple of 16.")
+                    packer[option]['value'] = self.__supported_options['packer']['block_size']['value']
+            # If mode is not a supported AES mode, use CBC
+            elif option == 'mode':
+                if packer[option]['value'] not in ['cbc', 'ctr']:
+                    print("[-] Invalid value for packer mode, must be cbc or ctr.")
+                    packer[option]['value'] = 'cbc'
+            # If threads is not a positive number (0 for the number of CPU at runtime), use the number of CPU
+            elif option == 'threads':
+                if type(packer[option]['value']) is not int or packer[option]['value'] < 0 or packer[option]['value'] >= 2 ** 32:
+                    print("[-] Invalid value for packer threads, must be a positive number or 0.")
+                    packer[option]['value'] = 0
+            # If compression is not a supported compression, don't compress the binary
+            elif option == 'compression':
+                if packer[option]['value'] not in ['none', 'zlib', 'lzma']:
+                    print("[-] Invalid value for packer compression, must be none, zlib or lzma.")
+                    packer[option]['value'] = 'none'
+            # If compression_level is not between 0 and 9, use the default one
+            elif option == 'compression_level':
+                if type(packer[option]['value']) is not int or packer[option]['value'] < 0 or packer[option]['value'] > 9:
+                    print("[-] Invalid value for packer compression_level, must be between 0 and 9.")
+                    packer[option]['value'] = self.__supported_options['packer']['compression_level']['value']
+            # If key_derivation is not a supported hash of .text, use sha256
+            elif option == 'key_derivation':
+                if packer[option]['value'] not in ['sha256', 'tree']:
+                    print("[-] Invalid value for packer key_derivation, must be sha256 or tree.")
+                    packer[option]['value'] = 'sha256'
             # If value is not True or False, set it to False
-            if packer[option]['value'] not in [True, False]:
+            elif packer[option]['value'] not in [True, False]:
                 print("[-] Invalid value for packer {}, must be True or False.".format(option))
                 packer[option]['value'] = False
 
@@ -192,6 +292,97 @@ class embuche():
             print('[-] Can\'t use file format hacks on the packer if it\'s not enabled.')
             exit(1)
 
+        # Exit if packer is not used but envelope is set
+        if packer['packer']['value'] is False and packer['envelope']['value'] is True:
+            print('[-] Can\'t use the envelope mode of the packer if it\'s not enabled.')
+            exit(1)
+
+        # Exit if packer is not used but compression is set
+        if packer['packer']['value'] is False and packer['compression']['value'] != 'none':
+            print('[-] Can\'t compress the packed binary if the packer is not enabled.')
+            exit(1)
+
+    def __parse_build(self, build):
+        # Check if build is well configured (number of jobs and True or false value)
+        for option in build:
+            # If option doesn't exists in Embuche, exit
+            if option not in self.__supported_options['build'].keys():
+                print("[-] Unsupported build options: {}".format(option))
+                exit(1)
+
+        # If jobs is not a positive number, use the number of CPU
+        if build['jobs']['value'] is not None and (type(build['jobs']['value']) is not int or build['jobs']['value'] < 1):
+            print("[-] Invalid value for build jobs, must be a positive number.")
+            build['jobs']['value'] = None
+
+        # If value is not True or False, set it to False
+        if build['ninja']['value'] not in [True, False]:
+            print("[-] Invalid value for build ninja, must be True or False.")
+            build['ninja']['value'] = False
+
+        # If backend is unknown, use CMake
+        if build['backend']['value'] not in ['cmake', 'direct']:
+            print("[-] Invalid value for build backend, must be cmake or direct.")
+            build['backend']['value'] = 'cmake'
+
+    def get_jobs(self):
+        # Return the number of compilation jobs (number of CPU by default)
+        jobs = self.get_conf()['options']['build']['jobs']['value']
+        return jobs if jobs is not None else os.cpu_count()
+
+    def get_variants(self):
+        # Return the number of variants built from the linked binary (1 for a single binary)
+        return self.get_conf()['variants']
+
+    def get_matrix(self):
+        # Return the combinations of the matrix (empty list without matrix), each combination has the values of the matrix and the options built with them
+        return self.__matrix
+
+    def get_generator(self):
+        # Return the CMake generator used for the project and the packer
+        return 'Ninja' if self.get_conf()['options']['build']['ninja']['value'] is True else 'Unix Makefiles'
+
+    def get_backend(self):
+        # Return the backend building the project: cmake (CMake and make or ninja) or direct (the compiler is executed by Embuche)
+        return self.get_conf()['options']['build']['backend']['value']
+
+    def __is_generator_changed(self):
+        # A build directory can't be used with another generator (or backend), return True if the CMake cache has been created with another one
+        # or if the build directory has been used by the other backend
+        if self.get_backend() == 'direct':
+            return os.path.exists(self.get_project_directory() + '/build/CMakeCache.txt')
+        elif os.path.exists(self.get_project_directory() + '/build/' + STATE_FILE):
+            return True
+
+        try:
+            with open(self.get_project_directory() + '/build/CMakeCache.txt', 'r') as target:
+                for line in target:
+                    if line.startswith('CMAKE_GENERATOR:INTERNAL='):
+                        return line.strip().split('=', 1)[1] != self.get_generator()
+        except FileNotFoundError:
+            pass
+
+        return False
+
+    def __is_cmake_cache_moved(self):
+        # A CMake cache can't be used from another directory, return True if the CMake cache has been created for another project directory
+        # (project moved or copied, build directory of the example)
+        directories = {
+            'CMAKE_CACHEFILE_DIR:INTERNAL': self.get_project_directory() + '/build',
+            'CMAKE_HOME_DIRECTORY:INTERNAL': self.get_project_directory()
+        }
+
+        try:
+            with open(self.get_project_directory() + '/build/CMakeCache.txt', 'r') as target:
+                for line in target:
+                    variable, _, value = line.strip().partition('=')
+                    if variable in directories and os.path.realpath(value) != os.path.realpath(directories[variable]):
+                        return True
+        except FileNotFoundError:
+            pass
+
+        return False
+
     def __parse_config(self):
         # Check if config is valid
         conf = self.get_conf()
@@ -209,6 +400,11 @@ class embuche():
                     print("{} doesn't exits".format(file))
                     exit(1)
 
+        # Check if the number of variants is a positive number, build a single binary otherwise
+        if type(conf['variants']) is not int or conf['variants'] < 1:
+            print("[-] Invalid value for variants, must be a positive number.")
+            conf['variants'] = 1
+
         if 'options' in conf:
             if 'compilation_options' in conf['options']:
                 # Check if compilation_options is well configured (True or false value and no duplicate options)
@@ -226,21 +422,313 @@ class embuche():
             if 'packer' in conf['options']:
                 # Check if packer is well configured (True or false value)
                 self.__parse_packer(conf['options']['packer'])
+
+            if 'build' in conf['options']:
+                # Check if build is well configured (number of jobs and True or false value)
+                self.__parse_build(conf['options']['build'])
         else:
             print("[-] Error, no options in yaml, please use the provided template.")
             exit(1)
 
+        # Without the envelope mode, the key of the packer only depends on the loader stub, the envelope mode gives a data key to each variant
+        packer = self.get_conf()['options']['packer']
+        if self.get_variants() > 1 and packer['packer']['value'] is True and packer['envelope']['value'] is False:
+            print('[+] The envelope mode of the packer is used to give a different key to each variant.')
+            packer['envelope']['value'] = True
+
+        # Check the matrix and expand it into the combinations of options
+        self.__parse_matrix(conf['matrix'])
+
+    def __parse_matrix(self, matrix):
+        # The matrix gives a list of values for some options (type: option: values), every combination of these values is built
+        # with the other options of the config file, each combination is checked like the options and skipped if it's invalid
+        self.__matrix = []
+
+        if not matrix:
+            return
+
+        if type(matrix) is not dict:
+            print("[-] Invalid matrix, must be a dictionnary of options.")
+            exit(1)
+
+        axes = []
+        for option_type in matrix:
+            # The build options don't change the binary
+            if option_type not in ['compilation_options', 'file_format', 'packer'] or type(matrix[option_type]) is not dict:
+                print("[-] Unsupported matrix options: {}".format(option_type))
+                exit(1)
+
+            for option in matrix[option_type]:
+                if option not in self.__supported_options[option_type].keys():
+                    print("[-] Unsupported matrix {} option: {}".format(option_type, option))
+                    exit(1)
+
+                if type(matrix[option_type][option]) is not list or len(matrix[option_type][option]) == 0:
+                    print("[-] Invalid values for matrix {} {}, must be a list of values.".format(option_type, option))
+                    exit(1)
+
+                axes.append((option_type, option, matrix[option_type][option]))
+
+        if self.get_variants() > 1:
+            print("[-] Can't build variants of a matrix, set variants or matrix.")
+            exit(1)
+
+        # The profile is collected for a single set of flags
+        if self.get_conf()['options']['compilation_options']['pgo']['value'] is True or 'pgo' in matrix.get('compilation_options', {}):
+            print("[-] Can't use pgo with a matrix.")
+            exit(1)
+
+        for values in itertools.product(*[axis[2] for axis in axes]):
+            options = copy.deepcopy(self.get_conf()['options'])
+            combination = OrderedDict()
+
+            for (option_type, option, _), value in zip(axes, values):
+                options[option_type][option]['value'] = value
+                combination[option] = value
+
+            description = ' '.join('{}={}'.format(option, value if type(value) is str else json.dumps(value)) for option, value in combination.items())
+
+            try:
+                self.__parse_compilation_options(options['compilation_options'])
+                self.__parse_file_format(options['file_format'], options['compilation_options'])
+                self.__parse_packer(options['packer'])
+            except SystemExit:
+                print("[-] Combination of the matrix skipped: {}".format(description))
+                continue
+
+            self.__matrix.append({'values': combination, 'description': description, 'options': options})
+
+        if len(self.__matrix) == 0:
+            print("[-] No valid combination in the matrix.")
+            exit(1)
+
+    def __set_toolbox(self, cache):
+        # The sources of the C toolbox listed in files are compiled once for each compiler and flags (with LTO, without PGO),
+        # the objects are kept in the cache directory (in the build directory without cache) and linked by every project with these flags
+        # With PGO, they're compiled with the project since the profile is the one of the project
+        if cache is not None:
+            self.__toolbox_directory = os.path.join(cache.get_cache_directory(), 'toolbox')
+        else:
+            self.__toolbox_directory = self.get_project_directory() + '/build/toolbox'
+
+        # The combinations of a matrix have their own flags
+        if self.get_matrix():
+            self.__toolbox = {'objects': {}}
+        else:
+            self.__toolbox = self.__get_toolbox(self.get_conf()['options']['compilation_options'])
+
+    def __get_toolbox(self, compilation_options):
+        # Return the compiler, the flags and the objects (source: object) of the toolbox for these compilation options, no objects with PGO
+        sources = get_toolbox_sources(self.get_conf()['files'])
+
+        if compilation_options['pgo']['value'] is True or not sources:
+            return {'objects': {}}
+
+        c_flags = get_c_flags(compilation_options)
+        if compilation_options['lto']['value'] is True:
+            c_flags += ' ' + LTO_C_FLAGS
+
+        return {
+            'compiler': get_compiler(compilation_options),
+            'c_flags': c_flags,
+            'objects': get_toolbox_objects(self.__toolbox_directory, get_compiler(compilation_options), self.__get_compiler_version(compilation_options), c_flags, sources)
+        }
+
+    def __set_cache(self, cache):
+        # The loader stubs of the packer are kept in the cache directory (in the build directory without cache), variants use them as well
+        if cache is not None:
+            self.__stubs_directory = os.path.join(cache.get_cache_directory(), 'stubs')
+        else:
+            self.__stubs_directory = self.get_project_directory() + '/build/packer_stubs'
+
+        # Variants and matrices are built with new seeds each time, they're never stored in the cache
+        self.__cache = cache if self.get_variants() == 1 and not self.get_matrix() else None
+        self.__restored_from_cache = False
+
+        if self.__cache is not None:
+            self.__cache_key = self.__get_cache_key()
+
+            # Create output dir (bin) in project directory if it doesn't exists
+            os.makedirs(self.get_project_directory() + '/bin', exist_ok=True)
+            self.__restored_from_cache = self.__cache.get(self.__cache_key, self.get_project_directory() + '/bin/' + self.get_project_name())
+
+    def is_restored_from_cache(self):
+        # Return True if the binary has been restored from the cache
+        return self.__restored_from_cache
+
+    def __get_compiler_version(self, compilation_options=None):
+        # Return the version of the compiler CMake will use (with the compilation options of the config file if None)
+        compiler = get_compiler(compilation_options if compilation_options is not None else self.get_conf()['options']['compilation_options'])
+
+        try:
+            return subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
+        except FileNotFoundError:
+            return b''
+
+    def __get_sources_parts(self):
+        # Return the name and the hash of each source (files in c_toolbox overwrite the ones in src/)
+        c_toolbox = os.path.dirname(os.path.realpath(__file__)) + '/c_toolbox/'
+
+        sources = {}
+        for file in glob.glob(self.get_project_directory() + '/src/**/*', recursive=True):
+            if os.path.isfile(file):
+                sources[os.path.relpath(file, self.get_project_directory() + '/src/')] = file
+        for file in glob.glob(os.path.join(c_toolbox, '*.*')):
+            sources[os.path.basename(file)] = file
+
+        return [name + hash_file(sources[name]) for name in sorted(sources)]
+
+    def __get_cache_key(self):
+        # The key of a build is the hash of everything that changes the final binary:
+        # - the sources (files in c_toolbox overwrite the ones in src/)
+        # - the options (without descriptions), the training command of pgo and the list of files
+        # - the CMake files rendered for the build and the packer
+        # - the version of the compiler
+        # - the scripts and packer sources of Embuche
+        embuche_tools = os.path.dirname(os.path.realpath(__file__)) + '/cmake_bakery/'
+
+        tools = [file for file in glob.glob(embuche_tools + '**/*', recursive=True) if os.path.isfile(file) and '__pycache__' not in file]
+
+        # Build options (jobs, generator) don't change the binary
+        options = {}
+        for type in self.get_conf()['options']:
+            if type == 'build':
+                continue
+            options[type] = {option: self.get_conf()['options'][type][option]['value'] for option in self.get_conf()['options'][type]}
+
+        parts = self.__get_sources_parts()
+        parts += [os.path.relpath(file, embuche_tools) + hash_file(file) for file in sorted(tools)]
+        parts += [
+            json.dumps(options, sort_keys=True),
+            self.get_conf()['options']['compilation_options']['pgo']['training'],
+            json.dumps(self.get_conf()['files']),
+            self.__cmake_bakery_embuche.get_render_template(),
+            self.__cmake_bakery_packer.get_render_template(),
+            self.__get_compiler_version()
+        ]
+
+        return compute_key(parts)
+
+    def __get_profile_key(self):
+        # The profile depends on the sources, the compilation options, the list of files, the training command and the version of the compiler
+        options = {option: self.get_conf()['options']['compilation_options'][option]['value'] for option in self.get_conf()['options']['compilation_options']}
+
+        return compute_key(['pgo'] + self.__get_sources_parts() + [
+            json.dumps(options, sort_keys=True),
+            json.dumps(self.get_conf()['files']),
+            self.get_conf()['options']['compilation_options']['pgo']['training'],
+            self.__get_compiler_version()
+        ])
+
+    def __build(self, build_directory, log=None, pgo=None, profile_directory=None):
+        # Compile and link the project, apply the file format hacks and copy the binary in bin/ with the backend of the project
+        # pgo is the step of the profile guided optimization (generate or use) and profile_directory the directory of the profile
+        if self.get_backend() == 'direct':
+            # The instrumented binary is only used by the training, the file format hacks are applied on the optimized one
+            with tracer.stage('direct_build', 'direct'):
+                self.__direct_build.build(build_directory, self.get_jobs(), pgo=pgo, profile_directory=profile_directory, post_link=pgo != 'generate', log=log)
+            return
+
+        # Execute CMake in the build directory if the CMake file changed (the step of PGO is given to CMake each time)
+        if self.__configure or pgo is not None:
+            definitions = ['-DEMBUCHE_PGO=' + pgo, '-DEMBUCHE_PGO_DIR=' + profile_directory] if pgo is not None else []
+            with tracer.stage('cmake_configure', 'cmake'):
+                subprocess.run(['cmake', '-G', self.get_generator()] + definitions + ['..'], cwd=build_directory, stdout=log, stderr=log, check=True)
+        # Execute make (or ninja) with several jobs, only the modified sources are compiled again (the hellf passes are executed by this step)
+        with tracer.stage('cmake_build', 'cmake'):
+            subprocess.run(['cmake', '--build', '.', '--parallel', str(self.get_jobs())], cwd=build_directory, stdout=log, stderr=log, check=True)
+
+    def __collect_profile(self, build_directory, profile_directory, log=None):
+        # Build the instrumented binary (-fprofile-generate) and run the training command on it, the profile is written in profile_directory
+        # {binary} in the training command is replaced by the path of the instrumented binary
+        shutil.rmtree(profile_directory, ignore_errors=True)
+        os.makedirs(profile_directory)
+
+        with tracer.stage('pgo_generate', 'cmake'):
+            self.__build(build_directory, log, 'generate', profile_directory)
+
+        training = self.get_conf()['options']['compilation_options']['pgo']['training'].replace('{binary}', build_directory + '/' + self.get_project_name())
+
+        with tracer.stage('pgo_training', 'cmake', training=training):
+            # The training can exit with an error (wrong password of a crackme...), the profile is written anyway
+            returncode = subprocess.run(training, shell=True, cwd=self.get_project_directory(), stdout=log, stderr=log).returncode
+
+        if returncode != 0:
+            print('[-] The training command exited with {}.'.format(returncode))
+
+        if len(glob.glob(profile_directory + '/**/*.gcda', recursive=True)) == 0:
+            print('[-] No profile written by the training command.')
+            exit(1)
+
+    def __run_pgo(self, build_directory, log=None):
+        # Profile guided optimization: the profile is collected once (kept in build/pgo and in the cache), then the binary is built with -fprofile-use,
+        # the file format hacks are applied on this binary
+        profile_directory = build_directory + '/pgo'
+        stamp = build_directory + '/pgo.stamp'
+        key = self.__get_profile_key()
+
+        ready = False
+        if os.path.exists(stamp) and os.path.exists(profile_directory):
+            with open(stamp, 'r') as target:
+                ready = target.read() == key
+
+        if not ready and self.__cache is not None:
+            # The profile is stored in the cache as a tar archive
+            archive = build_directory + '/pgo.tar'
+            if self.__cache.get(compute_key(['pgo', key]), archive):
+                shutil.rmtree(profile_directory, ignore_errors=True)
+                with tarfile.open(archive, 'r') as target:
+                    target.extractall(profile_directory)
+                os.remove(archive)
+                ready = True
+
+        if not ready:
+            self.__collect_profile(build_directory, profile_directory, log)
+
+            if self.__cache is not None:
+                archive = build_directory + '/pgo.tar'
+                with tarfile.open(archive, 'w') as target:
+                    target.add(profile_directory, arcname='.')
+                self.__cache.put(compute_key(['pgo', key]), archive)
+                os.remove(archive)
+
+        with open(stamp, 'w') as target:
+            target.write(key)
+
+        # Build with the profile, only the modified sources are compiled again if the profile didn't change
+        self.__build(build_directory, log, 'use', profile_directory)
+
+    def __print_lto_report(self, build_directory, log=None):
+        # Build the binary without link time optimization and garbage collection of the sections (EMBUCHE_LTO=OFF) in build/lto_reference
+        # and print the size of the sections of both, the reference is built incrementally like the project
+        reference_directory = build_directory + '/lto_reference'
+        os.makedirs(reference_directory, exist_ok=True)
+
+        if self.get_backend() == 'direct':
+            # Like the CMake reference, the profile is the one of the reference directory
+            self.__direct_build.build(reference_directory, self.get_jobs(), lto=False, profile_directory=reference_directory + '/pgo', post_link=False, log=log)
+        else:
+            subprocess.run(['cmake', '-G', self.get_generator(), '-DEMBUCHE_LTO=OFF', '../..'], cwd=reference_directory, stdout=log, stderr=log, check=True)
+            subprocess.run(['cmake', '--build', '.', '--target', self.get_project_name(), '--parallel', str(self.get_jobs())], cwd=reference_directory, stdout=log, stderr=log, check=True)
+
+        print_size_report(reference_directory + '/' + self.get_project_name(), build_directory + '/' + self.get_project_name(), 'Size of {} without LTO -> with LTO and --gc-sections'.format(self.get_project_name()))
+
     def prepare_cmake(self):
-        # Create CMake object
-        self.__cmake_bakery_embuche.create_cmakelist_file()
-        self.__cmake_bakery_packer.create_cmakelist_file()
+        # Nothing to compile if the binary comes from the cache
+        if self.is_restored_from_cache():
+            return
+
+        # Create CMake object, CMake only needs to configure the build again if the CMake file changed or if there's no CMake cache
+        with tracer.stage('write_cmakelists'):
+            changed = self.__cmake_bakery_embuche.create_cmakelist_file()
+            self.__configure = changed or not os.path.exists(self.get_project_directory() + '/build/CMakeCache.txt')
 
-    def __prepare_directories(self):
+    def __prepare_directories(self, clean=False):
         # Create build directory if it doesn't exists in project path
         if not os.path.exists(self.get_project_directory() + '/build'):
             os.makedirs(self.get_project_directory() + '/build')
-        else:
-            # Clean build directory if it already exists
+        elif clean or self.__is_generator_changed() or self.__is_cmake_cache_moved():
+            # Clean build directory if it already exists and a clean build is asked (or the CMake generator changed, or the CMake cache is the one of another directory)
             for files in os.listdir(self.get_project_directory() + '/build'):
                 # If file in build dir is a directory use shutil.rmtree
                 if os.path.isdir(self.get_project_directory() + '/build/' + files):
@@ -264,40 +752,214 @@ class embuche():
 
         # Copy files in c_toolbox to project directory
         for file in glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)) + '/c_toolbox/', '*.*')):
-            # If file in c_toolbox is not already in src dir, copy it
-            if not os.path.exists(self.get_project_directory() + '/src/' + file):
-                shutil.copy(file, self.get_project_directory() + '/src/')
-
-        # If packer directory already exists, remove it
-        if os.path.exists(self.get_project_directory() + '/packer'):
-            shutil.rmtree(self.get_project_directory() + '/packer')
-
-        # Copy the complete packer directory and subdirectories
-        shutil.copytree(os.path.join(os.path.dirname(os.path.realpath(__file__)) + '/cmake_bakery/packer'), self.get_project_directory() + '/packer')
+            # If file in c_toolbox is not already in src dir or is different, copy it
+            # (copying an unchanged file would change its modification time and make recompile it)
+            project_file = self.get_project_directory() + '/src/' + os.path.basename(file)
+            if not os.path.exists(project_file) or not filecmp.cmp(file, project_file, shallow=False):
+                shutil.copy(file, project_file)
+
+    def __get_packer(self, log=None, options=None):
+        # Return the packer of the project (see pack_binary): packer.py, the loader stub compiled for the toolchain (the first time it's used)
+        # and the options given to packer.py, options are the ones of a combination of the matrix (the ones of the config file if None)
+        if options is None:
+            cmakelists = self.__cmake_bakery_packer.get_render_template()
+            options = self.get_conf()['options']['packer']
+        else:
+            cmakelists = cmake_bakery(PACKER_DIRECTORY, self.get_project_name(), {'options': options, 'files': self.get_conf()['files']}, 'CMakeLists_packer.txt.Jinja').get_render_template()
+            options = options['packer']
+
+        with tracer.stage('packer_stub', 'packer'):
+            stub = get_stub(self.__stubs_directory, cmakelists, self.get_generator(), self.get_jobs(), log)
+
+        return {
+            'script': PACKER_SCRIPT,
+            'unloaded': stub,
+            'options': (['--envelope'] if options['envelope']['value'] else []) + ['--block-size', str(options['block_size']['value']), '--mode', options['mode']['value'], '--threads', str(options['threads']['value']), '--compression', options['compression']['value'], '--compression-level', str(options['compression_level']['value']), '--key-derivation', options['key_derivation']['value']],
+            'packer_embuche': options['packer_embuche']['value']
+        }
+
+    def __run_packer(self, build_directory, log=None):
+        # The packed binary is kept in the build directory with a stamp (hash of the binary to pack, of the stub, of packer.py and of the options),
+        # the packer is only executed again if one of them changed
+        binary = self.get_project_directory() + '/bin/' + self.get_project_name()
+        packed = build_directory + '/' + self.get_project_name() + '.packed'
+        stamp = build_directory + '/packer.stamp'
+
+        packer = self.__get_packer(log)
+        key = compute_key([hash_file(binary), hash_file(packer['unloaded']), hash_file(packer['script']), str(packer['packer_embuche'])] + packer['options'])
+
+        if os.path.exists(packed) and os.path.exists(stamp):
+            with open(stamp, 'r') as target:
+                if target.read() == key:
+                    shutil.copy(packed, binary)
+                    return
+
+        # Append the ciphered binary to a copy of the stub, no compilation is needed
+        with tracer.stage('pack', 'packer'):
+            pack_binary(binary, packed, packer, self.__cmake_bakery_embuche.get_template_dict()['hellf_script_path'], log=log)
+        # Replace the previously build program by the packed one
+        shutil.copy(packed, binary)
+
+        with open(stamp, 'w') as target:
+            target.write(key)
+
+    def __run_variants(self, build_directory, log=None):
+        # Build the variants in a process pool from the binary linked by CMake, each variant gets its own seed
+        # (random bases of the fake sections, symbols permutation, data key of the envelope mode of the packer)
+        # The variants are written in bin/variant_<number>/ with a manifest (bin/variants.json) of the seed and the sha256 of each variant
+        binary = self.get_project_directory() + '/bin/' + self.get_project_name()
+        packer = None
+
+        if self.get_conf()['options']['packer']['packer']['value'] is True:
+            # packer.py is executed for each variant with the same loader stub
+            packer = self.__get_packer(log)
+
+        os.makedirs(build_directory + '/variants', exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=self.get_jobs()) as executor:
+            futures = [executor.submit(build_variant,
+                                       variant,
+                                       get_seed(),
+                                       build_directory + '/' + self.get_project_name(),
+                                       self.get_project_directory() + '/bin/variant_{}/{}'.format(variant, self.get_project_name()),
+                                       self.__cmake_bakery_embuche.get_template_dict()['hellf_script_path'],
+                                       self.__cmake_bakery_embuche.get_template_dict()['file_format_passes'],
+                                       packer,
+                                       build_directory + '/variants/variant_{}.log'.format(variant)) for variant in range(self.get_variants())]
+            variants = [future.result() for future in futures]
+
+        for variant in variants:
+            variant['path'] = os.path.relpath(variant['path'], self.get_project_directory() + '/bin')
+            print('[+] Variant {} (seed {}) : {}'.format(variant['variant'], variant['seed'], variant['sha256']))
+
+        with open(self.get_project_directory() + '/bin/variants.json', 'w') as target:
+            json.dump({'project': self.get_project_name(), 'variants': variants}, target, indent=4)
+
+        # Only the variants are kept in bin, the binary built by CMake has the file format hacks of a single run
+        os.remove(binary)
+
+    def __run_matrix(self, build_directory, log=None):
+        # Build the combinations of the matrix: the combinations with the same compiler and flags are compiled and linked once
+        # in build/matrix/<key>/ (with the commands of the direct backend, several sets of flags can't share a CMake build directory),
+        # then the file format hacks and the packer of each combination are applied on a copy of its linked binary in a process pool
+        # The binaries are written in bin/matrix_<number>/ with a manifest (bin/matrix.json) and a summary is printed
+        groups = OrderedDict()
+
+        for number, combination in enumerate(self.get_matrix()):
+            toolbox = self.__get_toolbox(combination['options']['compilation_options'])
+            builder = direct_build(self.get_project_directory(), self.get_project_name(), {'options': combination['options'], 'files': self.get_conf()['files']}, [], None, toolbox['objects'])
+            c_flags, linker_flags = builder.get_flags()
+            key = compute_key(['matrix', get_compiler(combination['options']['compilation_options'])] + c_flags + linker_flags)[:16]
+
+            if key not in groups:
+                groups[key] = {'builder': builder, 'toolbox': toolbox, 'directory': build_directory + '/matrix/' + key, 'combinations': []}
+            groups[key]['combinations'].append(number)
+            combination['flags'] = ' '.join(c_flags + linker_flags)
+
+        # The jobs are shared by the compilations
+        jobs = max(1, self.get_jobs() // len(groups))
+
+        def build_group(group):
+            if group['toolbox']['objects']:
+                build_toolbox_objects(group['toolbox']['objects'], group['toolbox']['compiler'], group['toolbox']['c_flags'], jobs, log)
+
+            with tracer.stage('matrix_build', 'matrix', flags=group['builder'].get_flags()[0]):
+                group['builder'].build(group['directory'], jobs, post_link=False, log=log)
+
+        with ThreadPoolExecutor(max_workers=min(self.get_jobs(), len(groups))) as executor:
+            for future in [executor.submit(build_group, group) for group in groups.values()]:
+                future.result()
+
+        # A packer (loader stub) for each combination with the packer, the stubs are compiled once for each compression
+        packers = [self.__get_packer(log, combination['options']) if combination['options']['packer']['packer']['value'] is True else None for combination in self.get_matrix()]
+        linked = {number: group['directory'] + '/' + self.get_project_name() for group in groups.values() for number in group['combinations']}
+
+        with ProcessPoolExecutor(max_workers=self.get_jobs()) as executor:
+            futures = [executor.submit(build_variant,
+                                       number,
+                                       get_seed(),
+                                       linked[number],
+                                       self.get_project_directory() + '/bin/matrix_{}/{}'.format(number, self.get_project_name()),
+                                       self.__cmake_bakery_embuche.get_template_dict()['hellf_script_path'],
+                                       get_file_format_passes(combination['options']),
+                                       packers[number],
+                                       build_directory + '/matrix/matrix_{}.log'.format(number)) for number, combination in enumerate(self.get_matrix())]
+            results = [future.result() for future in futures]
+
+        print('[+] Matrix of {} : {} combination(s), {} compilation(s)'.format(self.get_project_name(), len(results), len(groups)))
+        print('{:<4} {:>10} {:<16} {}'.format('#', 'Size', 'sha256', 'Options'))
+
+        matrix = []
+        for result, combination in zip(results, self.get_matrix()):
+            size = os.path.getsize(result['path'])
+            print('{:<4} {:>10} {:<16} {}'.format(result['variant'], size, result['sha256'][:16], combination['description']))
+
+            matrix.append({
+                'matrix': result['variant'],
+                'options': combination['values'],
+                'flags': combination['flags'],
+                'passes': get_file_format_passes(combination['options']),
+                'seed': result['seed'],
+                'size': size,
+                'sha256': result['sha256'],
+                'path': os.path.relpath(result['path'], self.get_project_directory() + '/bin')
+            })
+
+        with open(self.get_project_directory() + '/bin/matrix.json', 'w') as target:
+            json.dump({'project': self.get_project_name(), 'matrix': matrix}, target, indent=4)
+
+    def run(self, log=None):
+        # Every command is executed in its own directory (cwd) instead of changing the directory of the whole process,
+        # the output of the commands goes to log if it's set (file object)
+        if self.is_restored_from_cache():
+            print('[+] {} restored from the cache.'.format(self.get_project_name()))
+            return
 
-    def run(self):
         try:
-            # Go to the build directory
-            os.chdir(self.get_project_directory() + '/build')
-            # Execute CMake
-            subprocess.run(['cmake', '..'])
-            # Execute make
-            subprocess.run(['make'])
+            build_directory = self.get_project_directory() + '/build'
+
+            if self.get_matrix():
+                # Every combination of the matrix is built instead of the binary of the config file
+                with tracer.stage('matrix', 'matrix', combinations=len(self.get_matrix())):
+                    self.__run_matrix(build_directory, log)
+                return
+
+            # Compile the objects of the toolbox if no project compiled them with the same flags yet
+            if self.__toolbox['objects']:
+                with tracer.stage('toolbox_build', 'toolbox'):
+                    build_toolbox_objects(self.__toolbox['objects'], self.__toolbox['compiler'], self.__toolbox['c_flags'], self.get_jobs(), log)
+
+            if self.get_conf()['options']['compilation_options']['pgo']['value'] is True:
+                # Build with profile guided optimization (instrumented build and training if there's no profile yet)
+                with tracer.stage('pgo', 'cmake'):
+                    self.__run_pgo(build_directory, log)
+            else:
+                self.__build(build_directory, log)
 
+            # Compare the size of the linked binary with a build without LTO
+            if self.get_conf()['options']['compilation_options']['lto']['value'] is True:
+                with tracer.stage('lto_report', 'cmake'):
+                    self.__print_lto_report(build_directory, log)
+
+            if self.get_variants() > 1:
+                # The file format hacks and the packer are applied on the linked binary once for each variant
+                with tracer.stage('variants', 'variants', variants=self.get_variants()):
+                    self.__run_variants(build_directory, log)
             # If packer is wanted
-            if self.get_conf()['options']['packer']['packer']['value'] is True:
-                # Go to packer directory
-                os.chdir(self.get_project_directory() + '/packer')
-                # Execute CMake
-                subprocess.run(['cmake', '.'])
-                # Execute make
-                subprocess.run(['make'])
-                # Delete packer directory in the program directory
-                shutil.rmtree(self.get_project_directory() + '/packer')
-                # Rename replace the previously build program by the packed one
-                shutil.copy(self.get_project_directory() + '/bin/' + self.get_project_name() + '_packed', self.get_project_directory() + '/bin/' + self.get_project_name())
-                # Delete the duplicated packed one
-                os.remove(self.get_project_directory() + '/bin/' + self.get_project_name() + '_packed')
+            elif self.get_conf()['options']['packer']['packer']['value'] is True:
+                with tracer.stage('packer', 'packer'):
+                    self.__run_packer(build_directory, log)
+
+            # Store the final binary in the cache
+            if self.__cache is not None:
+                with tracer.stage('cache_store'):
+                    self.__cache.put(self.__cache_key, self.get_project_directory() + '/bin/' + self.get_project_name())
+        except subprocess.CalledProcessError as e:
+            # A command (CMake, make, the compiler or a script) failed, its output is in the log
+            command = e.cmd if isinstance(e.cmd, str) else ' '.join(str(argument) for argument in e.cmd)
+            print('[-] Error while executing cmake/make: {} (exit status {}).'.format(command, e.returncode))
+            exit(1)
         except Exception as e:
-            print('[-] Error while executing cmake/make.')
+            # The other steps (cache, toolbox objects, variants, matrix...) fail without command
+            print('[-] Error while building {}: {}: {}'.format(self.get_project_name(), type(e).__name__, e))
             exit(1)
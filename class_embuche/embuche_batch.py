@@ -0,0 +1,147 @@
+import os
+import glob
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .embuche import embuche
+from . import tracer
+
+def build_projects(config_files, cache=None, clean=False, jobs=None):
+    # Build the projects of the config files one after the other (they all share the same project directory)
+    # and return the result of each build, it's executed in a worker of the pool
+    results = []
+
+    for config_file in config_files:
+        start = time.time()
+        log_path = None
+        error = None
+
+        try:
+            with tracer.stage('build_project', config_file=config_file):
+                project = embuche(config_file, cache, clean, jobs)
+                project.prepare_cmake()
+
+                if project.is_restored_from_cache():
+                    project.run()
+                else:
+                    # Output of CMake and make goes to a log file in the build directory, otherwise the output of all the builds is mixed
+                    log_path = project.get_project_directory() + '/build/embuche.log'
+                    with open(log_path, 'w') as log:
+                        project.run(log)
+
+            success = True
+        except SystemExit:
+            # embuche exits when there's an error in the config or the compilation
+            success = False
+        except Exception as e:
+            # Any other error (cache directory, toolbox lock, templates...) only fails this config file, the other ones are built
+            success = False
+            error = '{}: {}'.format(type(e).__name__, e)
+
+        results.append({
+            'config_file': config_file,
+            'success': success,
+            'duration': time.time() - start,
+            'log': log_path,
+            'error': error
+        })
+
+    return results
+
+class embuche_batch():
+    def __init__(self, paths, workers=None, cache=None, clean=False, jobs=None):
+        # Number of projects built at the same time
+        self.__workers = workers if workers is not None else os.cpu_count()
+        # Cache shared by the workers (artifact_cache object or None)
+        self.__cache = cache
+        # Remove the build directory of the projects before building them
+        self.__clean = clean
+        # Number of compilation jobs of each project (None to use the config files)
+        self.__jobs = jobs
+        # Set list of config files (a path can be a config file or a directory of config files)
+        self.__set_config_files(paths)
+        # Group config files by project directory
+        self.__group_projects()
+
+    def __set_config_files(self, paths):
+        self.__config_files = []
+
+        for path in paths:
+            if os.path.isdir(path):
+                # Take every yaml file in the directory
+                self.__config_files += sorted(glob.glob(os.path.join(path, '*.yaml')) + glob.glob(os.path.join(path, '*.yml')))
+            elif os.path.exists(path):
+                self.__config_files.append(path)
+            else:
+                print("{} doesn't exits".format(path))
+                exit(1)
+
+        if len(self.__config_files) == 0:
+            print('[-] No config file to build.')
+            exit(1)
+
+    def get_config_files(self):
+        # Return the list of config files to build
+        return self.__config_files
+
+    def __get_project_directory(self, config_file):
+        # Compute the project directory like embuche does, without preparing it
+        try:
+            with open(config_file, 'r') as target:
+                source_code = yaml.safe_load(target)['source_code']
+            return os.path.dirname(os.path.abspath(os.path.join(source_code, os.pardir)))
+        except Exception as e:
+            # The error will be reported by embuche when building it
+            return config_file
+
+    def __group_projects(self):
+        # Config files that build the same project can't be built at the same time (they use the same build and bin directories),
+        # each project is built by one worker from the list of its config files
+        self.__projects = {}
+
+        for config_file in self.get_config_files():
+            self.__projects.setdefault(self.__get_project_directory(config_file), []).append(config_file)
+
+    def get_projects(self):
+        # Return the list of config files by project directory
+        return self.__projects
+
+    def run(self):
+        # Build all projects in a bounded process pool, print a summary and return True if every build succeeded
+        start = time.time()
+        results = []
+
+        with ProcessPoolExecutor(max_workers=self.__workers) as executor:
+            futures = {executor.submit(build_projects, config_files, self.__cache, self.__clean, self.__jobs): config_files for config_files in self.get_projects().values()}
+
+            for future in as_completed(futures):
+                try:
+                    project_results = future.result()
+                except Exception as e:
+                    # The worker died (killed, out of memory), every config file of the project failed
+                    project_results = [{'config_file': config_file, 'success': False, 'duration': 0, 'log': None, 'error': '{}: {}'.format(type(e).__name__, e)} for config_file in futures[future]]
+
+                for result in project_results:
+                    print('[{}] {} ({:.2f}s)'.format('+' if result['success'] else '-', result['config_file'], result['duration']))
+                    results.append(result)
+
+        self.__print_summary(results, time.time() - start)
+
+        return all(result['success'] for result in results)
+
+    def __print_summary(self, results, duration):
+        failed = [result for result in results if not result['success']]
+
+        print('')
+        print('{:<60} {:<8} {:>10}'.format('Config file', 'Status', 'Time (s)'))
+        for result in sorted(results, key=lambda result: result['config_file']):
+            print('{:<60} {:<8} {:>10.2f}'.format(result['config_file'], 'OK' if result['success'] else 'FAILED', result['duration']))
+
+        print('')
+        print('[+] {} project(s) built, {} failed in {:.2f}s with {} worker(s).'.format(len(results) - len(failed), len(failed), duration, self.__workers))
+
+        for result in failed:
+            if result['error'] is not None:
+                print('[-] {} : {}'.format(result['config_file'], result['error']))
+            if result['log'] is not None:
+                print('[-] See {} for the output of {}'.format(result['log'], result['config_file']))
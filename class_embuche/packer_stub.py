@@ -0,0 +1,81 @@
+import os
+import glob
+import fcntl
+import shutil
+import tempfile
+import subprocess
+from .artifact_cache import compute_key, hash_file
+from . import tracer
+
+# Sources of the packer, the loader stub is compiled from includes/ and src/, scripts/ is only used to pack
+PACKER_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cmake_bakery', 'packer')
+PACKER_SCRIPT = os.path.join(PACKER_DIRECTORY, 'scripts', 'packer.py')
+
+def get_toolchain():
+    # Return the C compiler used by CMake (CC or cc) and its version, a stub is compiled for each toolchain
+    compiler = os.environ.get('CC', 'cc')
+
+    try:
+        version = subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode()
+    except (OSError, subprocess.CalledProcessError):
+        version = ''
+
+    return compiler + '\n' + version
+
+def get_stub_sources():
+    # Return the sources of the loader stub (relative path: path)
+    sources = {}
+
+    for directory in ['includes', 'src']:
+        for file in glob.glob(os.path.join(PACKER_DIRECTORY, directory, '**', '*'), recursive=True):
+            if os.path.isfile(file):
+                sources[os.path.relpath(file, PACKER_DIRECTORY)] = file
+
+    return sources
+
+def get_stub_key(cmakelists):
+    # The key of a stub is the hash of the rendered CMake file (compression), of its sources and of the toolchain
+    sources = get_stub_sources()
+
+    return compute_key(['packer_stub', cmakelists, get_toolchain()] + [name + hash_file(sources[name]) for name in sorted(sources)])
+
+def get_stub(stubs_directory, cmakelists, generator, jobs, log=None):
+    # Return the path of the loader stub (unloaded) rendered from cmakelists, the stub is compiled the first time it's asked
+    # and kept in stubs_directory/<key>/ for the next builds (the projects built at the same time wait for the same compilation)
+    key = get_stub_key(cmakelists)
+    stub = os.path.join(stubs_directory, key, 'unloaded')
+
+    if os.path.exists(stub):
+        return stub
+
+    os.makedirs(stubs_directory, exist_ok=True)
+
+    with open(os.path.join(stubs_directory, key + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Compiled by another process while waiting for the lock
+        if os.path.exists(stub):
+            return stub
+
+        build_directory = tempfile.mkdtemp(dir=stubs_directory, prefix='.tmp_')
+
+        try:
+            for directory in ['includes', 'src']:
+                shutil.copytree(os.path.join(PACKER_DIRECTORY, directory), os.path.join(build_directory, directory))
+
+            with open(os.path.join(build_directory, 'CMakeLists.txt'), 'w') as target:
+                target.write(cmakelists)
+
+            with tracer.stage('packer_stub_configure', 'packer'):
+                subprocess.run(['cmake', '-G', generator, '.'], cwd=build_directory, stdout=log, stderr=log, check=True)
+            with tracer.stage('packer_stub_build', 'packer'):
+                subprocess.run(['cmake', '--build', '.', '--parallel', str(jobs)], cwd=build_directory, stdout=log, stderr=log, check=True)
+
+            # The stub is renamed once complete so a concurrent build never sees half a stub
+            os.makedirs(os.path.dirname(stub), exist_ok=True)
+            shutil.copy2(os.path.join(build_directory, 'unloaded'), stub + '.tmp')
+            os.replace(stub + '.tmp', stub)
+        finally:
+            shutil.rmtree(build_directory, ignore_errors=True)
+
+    return stub
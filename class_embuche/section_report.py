@@ -0,0 +1,57 @@
+import os
+from collections import OrderedDict
+from struct import unpack_from
+
+SHF_ALLOC = 0x2
+SHT_NOBITS = 0x8
+
+def get_section_sizes(binary):
+    # Return the size of the sections loaded in memory (name: size) of an ELF64, only the section header table and the names are read
+    with open(binary, 'rb') as target:
+        ehdr = target.read(64)
+        e_shoff, = unpack_from('<Q', ehdr, 0x28)
+        e_shentsize, e_shnum, e_shstrndx = unpack_from('<HHH', ehdr, 0x3A)
+
+        if e_shoff == 0 or e_shnum == 0:
+            return OrderedDict()
+
+        target.seek(e_shoff)
+        table = target.read(e_shentsize * e_shnum)
+        # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size
+        headers = [unpack_from('<IIQQQQ', table, index * e_shentsize) for index in range(e_shnum)]
+
+        target.seek(headers[e_shstrndx][4])
+        names = target.read(headers[e_shstrndx][5])
+
+    sizes = OrderedDict()
+    for sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size in headers:
+        if sh_flags & SHF_ALLOC:
+            sizes[names[sh_name:names.index(b'\x00', sh_name)].decode()] = sh_size
+
+    return sizes
+
+def get_size_report(reference, binary):
+    # Compare the sections of binary with the ones of reference, return the lines of the report (section, size in reference, size in binary)
+    before = get_section_sizes(reference)
+    after = get_section_sizes(binary)
+
+    report = [(name, before.get(name, 0), after.get(name, 0)) for name in list(before) + [name for name in after if name not in before]]
+    report.append(('Loaded sections', sum(before.values()), sum(after.values())))
+    report.append(('File', os.path.getsize(reference), os.path.getsize(binary)))
+
+    return report
+
+def print_size_report(reference, binary, title):
+    # Print the size of each section before and after, the sections which didn't change are not printed
+    print('[+] {}'.format(title))
+    print('{:<24} {:>12} {:>12} {:>18}'.format('Section', 'Before', 'After', 'Diff'))
+
+    for name, before, after in get_size_report(reference, binary):
+        if before == after and name not in ['.text', 'Loaded sections', 'File']:
+            continue
+
+        diff = '{:+d}'.format(after - before)
+        if before != 0:
+            diff += ' ({:+.1f}%)'.format((after - before) * 100 / before)
+
+        print('{:<24} {:>12} {:>12} {:>18}'.format(name, before, after, diff))
@@ -0,0 +1,67 @@
+import os
+import glob
+import shlex
+import fcntl
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from .artifact_cache import compute_key, hash_file
+from . import tracer
+
+# Sources shared by the projects, the ones listed in files are compiled once for each compiler and flags
+TOOLBOX_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'c_toolbox')
+
+def get_toolbox_sources(files):
+    # Return the C sources of the toolbox listed in the files of a project, in order
+    return [file for file in files if file.endswith('.c') and os.path.isfile(os.path.join(TOOLBOX_DIRECTORY, file))]
+
+def get_toolbox_key(compiler, compiler_version, c_flags):
+    # The key of a set of objects is the hash of the compiler and its version, of the flags and of every file of the toolbox (headers included)
+    files = sorted(file for file in glob.glob(os.path.join(TOOLBOX_DIRECTORY, '*.*')) if os.path.isfile(file))
+
+    return compute_key(['c_toolbox', compiler, compiler_version, c_flags] + [os.path.basename(file) + hash_file(file) for file in files])
+
+def get_toolbox_objects(objects_directory, compiler, compiler_version, c_flags, sources):
+    # Return the path of the object of each source (source: object) compiled with compiler and c_flags, in objects_directory/<key>/
+    directory = os.path.join(objects_directory, get_toolbox_key(compiler, compiler_version, c_flags))
+
+    return {source: os.path.join(directory, source + '.o') for source in sources}
+
+def build_toolbox_objects(objects, compiler, c_flags, jobs, log=None):
+    # Compile the objects of the toolbox which don't exist yet (see get_toolbox_objects), in parallel,
+    # the projects built at the same time with the same flags wait for the same compilation
+    missing = [source for source, obj in objects.items() if not os.path.exists(obj)]
+
+    if not missing:
+        return
+
+    directory = os.path.dirname(objects[missing[0]])
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+
+    with open(directory + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Compiled by another process while waiting for the lock
+        missing = [source for source in missing if not os.path.exists(objects[source])]
+        if not missing:
+            return
+
+        build_directory = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix='.tmp_')
+
+        def compile(source):
+            # Same command as the one of the project (CMake or direct backend), from the toolbox directory
+            with tracer.stage('toolbox_compile', 'toolbox', source=source):
+                subprocess.run([compiler] + shlex.split(c_flags) + ['-o', source + '.o', '-c', os.path.join(TOOLBOX_DIRECTORY, source)], cwd=build_directory, stdout=log, stderr=log, check=True)
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for future in [executor.submit(compile, source) for source in missing]:
+                    future.result()
+
+            # The objects are moved once complete so a concurrent build never sees half an object
+            os.makedirs(directory, exist_ok=True)
+            for source in missing:
+                os.replace(os.path.join(build_directory, source + '.o'), objects[source])
+        finally:
+            shutil.rmtree(build_directory, ignore_errors=True)
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+# This module only uses the standard library, elf_passes.py and packer.py import it to append their events to the trace
+
+# The path of the file where the events are appended is given to the child processes (scripts executed by CMake) in this variable
+TRACE_VARIABLE = 'EMBUCHE_TRACE'
+
+# Peak RSS of the process (VmHWM), Linux resets it to the current RSS when 5 is written in clear_refs
+STATUS_PATH = '/proc/self/status'
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+# Measures of the stages running in this process (several threads can run stages), the peak RSS is reset when a stage starts,
+# the peak reached until then is given to the stages still running first
+running_measures = []
+running_lock = threading.Lock()
+
+def get_events_path(trace_path):
+    # Return the path of the file where the events of the trace are appended (one JSON event by line)
+    return trace_path + '.events'
+
+def start(trace_path):
+    # Start a trace, the stages of Embuche and of the child processes are appended to the events file until save is called
+    events_path = os.path.abspath(get_events_path(trace_path))
+    open(events_path, 'w').close()
+    os.environ[TRACE_VARIABLE] = events_path
+
+def append_event(event):
+    # Append an event to the events file of the current trace, the file is opened in append mode so several processes can write in it
+    with open(os.environ[TRACE_VARIABLE], 'a') as target:
+        target.write(json.dumps(event) + '\n')
+
+def get_children_usage():
+    # Return the CPU time (s) and peak RSS (KB) of the terminated child processes (compilers, scripts),
+    # the peak RSS is the one of the biggest child since the start of the process, not the one of a stage
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+def get_rss():
+    # Return the current RSS and the peak RSS (KB) of the process, None if /proc isn't available
+    try:
+        with open(STATUS_PATH, 'r') as target:
+            status = target.read()
+        return int(re.search(r'VmRSS:\s+(\d+)', status).group(1)), int(re.search(r'VmHWM:\s+(\d+)', status).group(1))
+    except (OSError, AttributeError):
+        return None
+
+def reset_peak_rss():
+    # Reset the peak RSS of the process to its current RSS, return False if the kernel doesn't allow it
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as target:
+            target.write('5')
+        return True
+    except OSError:
+        return False
+
+def start_measure():
+    # Return the state of the process at the start of a stage (None if there's no trace), given to make_event at the end of the stage
+    if TRACE_VARIABLE not in os.environ:
+        return None
+
+    measure = {
+        'start_time': time.time_ns() // 1000,
+        'start_cpu': time.process_time(),
+        'start_children_cpu': get_children_usage()[0],
+        'start_rss': None,
+        'peak_rss': 0
+    }
+
+    with running_lock:
+        rss = get_rss()
+
+        if rss is not None:
+            for running in running_measures:
+                running['peak_rss'] = max(running['peak_rss'], rss[1])
+
+            if reset_peak_rss():
+                # The RSS of a process forked from the daemon already counts the pages of the daemon, the growth is the memory used by the stage
+                measure['start_rss'] = measure['peak_rss'] = rss[0]
+                running_measures.append(measure)
+
+    return measure
+
+def make_event(name, category, measure, **args):
+    # Return the complete event (Chrome trace format) of a stage started with start_measure: wall time, CPU time of the process
+    # and of its children, and peak RSS of the process during the stage (if the kernel can reset it)
+    children_cpu, children_rss = get_children_usage()
+    args.update({
+        'cpu_ms': (time.process_time() - measure['start_cpu']) * 1000,
+        'children_cpu_ms': (children_cpu - measure['start_children_cpu']) * 1000,
+        'children_cumulative_max_rss_kb': children_rss
+    })
+
+    with running_lock:
+        if any(running is measure for running in running_measures):
+            running_measures[:] = [running for running in running_measures if running is not measure]
+            rss = get_rss()
+            peak_rss = max(measure['peak_rss'], rss[1] if rss is not None else 0)
+
+            args.update({
+                'start_rss_kb': measure['start_rss'],
+                'peak_rss_kb': peak_rss,
+                'peak_rss_growth_kb': peak_rss - measure['start_rss']
+            })
+
+    return {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': measure['start_time'],
+        'dur': time.time_ns() // 1000 - measure['start_time'],
+        'pid': os.getpid(),
+        'tid': threading.get_native_id(),
+        'args': args
+    }
+
+def record(name, category, measure, **args):
+    # Append the event of a stage started with start_measure to the trace, nothing is recorded if there's no trace
+    if measure is not None:
+        append_event(make_event(name, category, measure, **args))
+
+@contextmanager
+def stage(name, category='embuche', **args):
+    # Record a stage of Embuche as a complete event (see make_event), nothing is recorded if there's no trace
+    measure = start_measure()
+
+    try:
+        yield
+    finally:
+        record(name, category, measure, **args)
+
+def save(trace_path):
+    # Write the events in a JSON file readable by chrome://tracing and Perfetto and stop the trace
+    events_path = get_events_path(trace_path)
+    events = []
+
+    with open(events_path, 'r') as target:
+        for line in target:
+            if line.strip():
+                events.append(json.loads(line))
+
+    # Name the processes in the trace
+    names = {}
+    for event in events:
+        names.setdefault(event['pid'], event.get('args', {}).get('process', 'embuche'))
+
+    events += [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': '{} ({})'.format(process, pid)}} for pid, process in names.items()]
+
+    with open(trace_path, 'w') as target:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, target)
+
+    os.remove(events_path)
+    del os.environ[TRACE_VARIABLE]
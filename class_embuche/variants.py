@@ -0,0 +1,50 @@
+import os
+import shutil
+import secrets
+from .artifact_cache import hash_file
+from .daemon_client import run_script
+from . import tracer
+
+# File format hacks applied on the packer when packer_embuche is set (like CMakeLists_packer.txt.Jinja)
+PACKER_EMBUCHE_PASSES = ['flip_sections_flags_and_hide_entry_point', 'endianness']
+
+def get_seed():
+    # Random seed of a variant (128 bits), it's recorded in the manifest to build the same variant again
+    return secrets.randbits(128)
+
+def pack_binary(binary, output, packer, hellf_script_path, seed=None, log=None):
+    # Append the ciphered binary to a copy of the loader stub (output), then apply the file format hacks on the packer if packer_embuche is set
+    # packer is a dictionnary with the path to packer.py, to the loader stub, its options and if packer_embuche is set
+    seed_arguments = ['--seed', str(seed)] if seed is not None else []
+
+    run_script(packer['script'], [packer['unloaded'], binary, output] + packer['options'] + seed_arguments, log)
+    os.chmod(output, 0o755)
+
+    if packer['packer_embuche']:
+        run_script(hellf_script_path + '/elf_passes.py', [output] + PACKER_EMBUCHE_PASSES + seed_arguments, log)
+
+def build_variant(variant, seed, linked, output, hellf_script_path, passes, packer=None, log_path=None):
+    # Build a variant from the linked binary: apply the file format hacks and the packer with the seed of the variant (in the daemon if the build is started by it),
+    # return the variant, its seed and the sha256 of the binary. It's executed in a worker of the pool.
+    # packer is None or a dictionnary (see pack_binary)
+    with tracer.stage('variant', 'variants', variant=variant, seed=str(seed)):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        shutil.copy(linked, output)
+
+        with open(log_path if log_path is not None else os.devnull, 'w') as log:
+            if passes:
+                run_script(hellf_script_path + '/elf_passes.py', [output] + passes + ['--seed', str(seed)], log)
+
+            if packer is not None:
+                packed = output + '_packed'
+                pack_binary(output, packed, packer, hellf_script_path, seed, log)
+
+                # The packed binary replaces the variant
+                os.replace(packed, output)
+
+    return {
+        'variant': variant,
+        'seed': seed,
+        'sha256': hash_file(output),
+        'path': output
+    }
@@ -1,13 +1,69 @@
 #!/usr/bin/python3.8
 # coding: utf-8
 import argparse
+import os
+import sys
 from class_embuche.embuche import embuche
+from class_embuche.embuche_batch import embuche_batch
+from class_embuche.artifact_cache import artifact_cache, DEFAULT_CACHE_DIRECTORY, DEFAULT_MAX_SIZE
+from class_embuche import tracer
 
 if __name__ == "__main__":
+    # embuche.py serve: the daemon keeps the templates and the scripts loaded, the builds are sent with class_embuche/daemon_client.py
+    if sys.argv[1:2] == ['serve']:
+        from class_embuche.daemon import embuche_daemon
+        from class_embuche.daemon_client import DAEMON_VARIABLE, DEFAULT_SOCKET
+
+        parser = argparse.ArgumentParser(prog='embuche.py serve', description='Embuche daemon, builds the projects and executes the scripts of CMake with warm interpreters.')
+        parser.add_argument('--socket', type=str, default=os.environ.get(DAEMON_VARIABLE, DEFAULT_SOCKET), help='Unix socket of the daemon (default: %(default)s).')
+        parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Number of builds (and of scripts) executed at the same time (default: number of CPU).')
+        parser.add_argument('--no-cache', action='store_true', help='Always build, don\'t read or store binaries in the cache.')
+        parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIRECTORY, help='Directory of the cache (default: {}).'.format(DEFAULT_CACHE_DIRECTORY))
+        parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), help='Maximum size of the cache in MB (default: %(default)s).')
+        args = parser.parse_args(sys.argv[2:])
+
+        cache = None if args.no_cache else artifact_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+        embuche_daemon(args.socket, args.workers, cache).serve()
+        exit(0)
+
     parser = argparse.ArgumentParser(description='Embuche, anti-reverse helper.')
-    parser.add_argument('config_file', type=str, help='Anti-reverse compilation.')
+    parser.add_argument('config_file', type=str, nargs='*', help='Anti-reverse compilation, several config files or directories of config files are built in parallel.')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Number of projects built at the same time in batch mode (default: number of CPU).')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of compilation jobs of each project, overrides the config file (default: number of CPU).')
+    parser.add_argument('--clean', action='store_true', help='Remove the build directory of the project(s) before building, everything is compiled again.')
+    parser.add_argument('--no-cache', action='store_true', help='Always build, don\'t read or store binaries in the cache.')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIRECTORY, help='Directory of the cache (default: {}).'.format(DEFAULT_CACHE_DIRECTORY))
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), help='Maximum size of the cache in MB, least recently used binaries are removed above it (default: %(default)s).')
+    parser.add_argument('--cache-stats', action='store_true', help='Print the statistics of the cache and exit.')
+    parser.add_argument('--trace', type=str, default=None, help='Write the wall time, CPU time and peak RSS of every stage and hellf pass in a Chrome trace file (chrome://tracing, Perfetto).')
     args = parser.parse_args()
 
-    embuche = embuche(args.config_file)
-    embuche.prepare_cmake()
-    embuche.run()
+    cache = None if args.no_cache else artifact_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    if args.cache_stats:
+        stats = artifact_cache(args.cache_dir, args.cache_size * 1024 * 1024).get_stats()
+        print('[+] Cache {} : {} hit(s), {} miss(es), {} eviction(s)'.format(args.cache_dir, stats['hits'], stats['misses'], stats['evictions']))
+        print('[+] {} binaries, {:.2f}/{:.2f} MB'.format(stats['entries'], stats['size'] / (1024 * 1024), stats['max_size'] / (1024 * 1024)))
+        exit(0)
+
+    if len(args.config_file) == 0:
+        parser.error('the following arguments are required: config_file')
+
+    if args.trace is not None:
+        tracer.start(args.trace)
+
+    try:
+        with tracer.stage('embuche'):
+            if len(args.config_file) == 1 and not os.path.isdir(args.config_file[0]):
+                embuche = embuche(args.config_file[0], cache, args.clean, args.jobs)
+                embuche.prepare_cmake()
+                embuche.run()
+            else:
+                batch = embuche_batch(args.config_file, args.workers, cache, args.clean, args.jobs)
+                if not batch.run():
+                    exit(1)
+    finally:
+        # The trace is also written if the build failed
+        if args.trace is not None:
+            tracer.save(args.trace)
+            print('[+] Trace saved to {}'.format(args.trace))
@@ -1,120 +0,0 @@
-# CMAKE generated file: DO NOT EDIT!
-# Generated by "Unix Makefiles" Generator, CMake Version 3.16
-
-# The generator used is:
-set(CMAKE_DEPENDS_GENERATOR "Unix Makefiles")
-
-# The top level Makefile was generated from the following files:
-set(CMAKE_MAKEFILE_DEPENDS
-  "CMakeCache.txt"
-  "../CMakeLists.txt"
-  "CMakeFiles/3.16.8/CMakeCCompiler.cmake"
-  "CMakeFiles/3.16.8/CMakeCXXCompiler.cmake"
-  "CMakeFiles/3.16.8/CMakeSystem.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCCompiler.cmake.in"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCCompilerABI.c"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCInformation.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCXXCompiler.cmake.in"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCXXCompilerABI.cpp"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCXXInformation.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCheckCompilerFlagCommonPatterns.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCommonLanguageInclude.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeCompilerIdDetection.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCXXCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCompileFeatures.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCompilerABI.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineCompilerId.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeDetermineSystem.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeFindBinUtils.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeGenericSystem.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeInitializeConfigs.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeLanguageInformation.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeParseImplicitIncludeInfo.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeParseImplicitLinkInfo.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeSystem.cmake.in"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeSystemSpecificInformation.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeSystemSpecificInitialize.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeTestCCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeTestCXXCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeTestCompilerCommon.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/CMakeUnixFindMake.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/ADSP-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/ARMCC-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/ARMClang-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/AppleClang-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Borland-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Bruce-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/CMakeCommonCompilerMacros.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Clang-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Clang-DetermineCompilerInternal.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Comeau-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Compaq-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Compaq-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Cray-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Embarcadero-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Fujitsu-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GHS-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU-C.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU-CXX.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU-FindBinUtils.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/GNU.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/HP-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/HP-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/IAR-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/IBMCPP-C-DetermineVersionInternal.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/IBMCPP-CXX-DetermineVersionInternal.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Intel-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/MSVC-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/NVIDIA-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/OpenWatcom-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/PGI-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/PathScale-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/SCO-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/SDCC-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/SunPro-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/SunPro-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/TI-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/TinyCC-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/VisualAge-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/VisualAge-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/Watcom-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/XL-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/XL-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/XLClang-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/XLClang-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/zOS-C-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Compiler/zOS-CXX-DetermineCompiler.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Internal/CMakeCheckCompilerFlag.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Internal/FeatureTesting.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/Linux-Determine-CXX.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/Linux-GNU-C.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/Linux-GNU-CXX.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/Linux-GNU.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/Linux.cmake"
-  "/opt/cmake/share/cmake-3.16/Modules/Platform/UnixPaths.cmake"
-  )
-
-# The corresponding makefile is:
-set(CMAKE_MAKEFILE_OUTPUTS
-  "Makefile"
-  "CMakeFiles/cmake.check_cache"
-  )
-
-# Byproducts of CMake generate step:
-set(CMAKE_MAKEFILE_PRODUCTS
-  "CMakeFiles/3.16.8/CMakeSystem.cmake"
-  "CMakeFiles/3.16.8/CMakeCCompiler.cmake"
-  "CMakeFiles/3.16.8/CMakeCXXCompiler.cmake"
-  "CMakeFiles/3.16.8/CMakeCCompiler.cmake"
-  "CMakeFiles/3.16.8/CMakeCXXCompiler.cmake"
-  "CMakeFiles/CMakeDirectoryInformation.cmake"
-  )
-
-# Dependency information for all targets:
-set(CMAKE_DEPEND_INFO_FILES
-  "CMakeFiles/crackme.dir/DependInfo.cmake"
-  )
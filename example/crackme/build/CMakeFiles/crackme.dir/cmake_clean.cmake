@@ -1,11 +0,0 @@
-file(REMOVE_RECURSE
-  "../bin/crackme"
-  "../bin/crackme.pdb"
-  "CMakeFiles/crackme.dir/src/anti_debug.c.o"
-  "CMakeFiles/crackme.dir/src/crackme.c.o"
-)
-
-# Per-language clean rules from dependency scanning.
-foreach(lang C)
-  include(CMakeFiles/crackme.dir/cmake_clean_${lang}.cmake OPTIONAL)
-endforeach()
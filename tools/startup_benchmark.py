@@ -0,0 +1,228 @@
+#!/usr/bin/python3.8
+# coding: utf-8
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from class_embuche.embuche import embuche
+
+# Packer options benchmarked, packer_embuche can't be used without the packer
+# (the packer is benchmarked again with each compression given in the arguments)
+COMBINATIONS = [
+    {'packer': False, 'packer_embuche': False, 'compression': 'none'},
+    {'packer': True, 'packer_embuche': False, 'compression': 'none'},
+    {'packer': True, 'packer_embuche': True, 'compression': 'none'}
+]
+
+# Each byte of a compressible payload is one of 16 letters (4 bits of entropy by byte)
+COMPRESSIBLE_TABLE = bytes(ord('a') + (byte & 0x0f) for byte in range(256))
+
+# Main program of the synthetic payloads: the payload (random data of the given size) is included in .rodata,
+# at the start of main it prints the monotonic clock and the I/O counters of the process (/proc/self/io),
+# execve keeps the process so the counters include what the packer did before running the payload
+BENCHMARK_SOURCE = r'''#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+__asm__(".section .rodata\n"
+        ".global payload\n"
+        "payload:\n"
+        ".incbin \"{payload}\"\n"
+        ".previous\n");
+
+extern const unsigned char payload[];
+
+int main(void) {{
+    struct timespec now;
+    char line[128];
+    unsigned long long value, rchar = 0, wchar = 0, syscr = 0, syscw = 0;
+
+    clock_gettime(CLOCK_MONOTONIC, &now);
+
+    FILE *io = fopen("/proc/self/io", "r");
+    if (io != NULL) {{
+        while (fgets(line, sizeof(line), io) != NULL) {{
+            if (sscanf(line, "rchar: %llu", &value) == 1) rchar = value;
+            if (sscanf(line, "wchar: %llu", &value) == 1) wchar = value;
+            if (sscanf(line, "syscr: %llu", &value) == 1) syscr = value;
+            if (sscanf(line, "syscw: %llu", &value) == 1) syscw = value;
+        }}
+        fclose(io);
+    }}
+
+    printf("%lld %llu %llu %llu %llu %d\n", (long long) now.tv_sec * 1000000000LL + now.tv_nsec, rchar, wchar, syscr, syscw, payload[0]);
+
+    return 0;
+}}
+'''
+
+def create_project(work_directory, size, compressible=False):
+    # Create the project of a payload of size MB (random data, with less entropy if compressible), return the path to the main source code
+    project = os.path.join(work_directory, 'payload_{}MB{}'.format(size, '_compressible' if compressible else ''))
+
+    for directory in ['bin', 'build', 'src']:
+        os.makedirs(os.path.join(project, directory), exist_ok=True)
+
+    payload = os.path.join(project, 'payload.bin')
+    if not os.path.exists(payload) or os.path.getsize(payload) != size * 1024 * 1024:
+        with open(payload, 'wb') as target:
+            for i in range(size):
+                chunk = os.urandom(1024 * 1024)
+                target.write(chunk.translate(COMPRESSIBLE_TABLE) if compressible else chunk)
+
+    source_code = os.path.join(project, 'src', 'bench.c')
+    with open(source_code, 'w') as target:
+        target.write(BENCHMARK_SOURCE.format(payload=payload))
+
+    return source_code
+
+def get_name(combination):
+    # Return the name of a combination of options
+    if not combination['packer']:
+        return 'unpacked'
+
+    name = 'packer_embuche' if combination['packer_embuche'] else 'packer'
+
+    return name + '_' + combination['compression'] if combination['compression'] != 'none' else name
+
+def build(source_code, combination, packer_options, log):
+    # Build the payload with Embuche and the given packer options, return the path of a copy of the binary
+    config_file = os.path.join(os.path.dirname(os.path.dirname(source_code)), get_name(combination) + '.yaml')
+
+    options = {'packer': {option: {'value': value} for option, value in combination.items()}}
+    if combination['packer']:
+        options['packer'].update({option: {'value': value} for option, value in packer_options.items()})
+
+    with open(config_file, 'w') as target:
+        yaml.safe_dump({'source_code': source_code, 'files': [], 'options': options}, target)
+
+    project = embuche(config_file)
+    project.prepare_cmake()
+    project.run(log)
+
+    # Each combination gets its own copy, the packer modifies the binary at each run
+    os.makedirs(os.path.join(project.get_project_directory(), 'benchmark'), exist_ok=True)
+    binary = os.path.join(project.get_project_directory(), 'benchmark', get_name(combination))
+    shutil.copy2(os.path.join(project.get_project_directory(), 'bin', project.get_project_name()), binary)
+
+    # The envelope mode saves its state next to the binary, the state of a previous benchmark doesn't belong to the new copy
+    if os.path.exists(binary + '.envelope'):
+        os.remove(binary + '.envelope')
+
+    return binary
+
+def percentile(values, rank):
+    # Nearest rank percentile
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(rank / 100 * len(values) + 0.5)) - 1))]
+
+def run(binary, runs):
+    # Run the binary runs times, return the latencies between the start of the process and main (ms) and the I/O counters of each run
+    latencies = []
+    counters = {'rchar': [], 'wchar': [], 'syscr': [], 'syscw': []}
+
+    for i in range(runs):
+        start = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+        output = subprocess.run([binary], stdout=subprocess.PIPE, check=True).stdout.split()
+
+        latencies.append((int(output[0]) - start) / 1000000)
+        for index, counter in enumerate(['rchar', 'wchar', 'syscr', 'syscw']):
+            counters[counter].append(int(output[index + 1]))
+
+    return latencies, counters
+
+def summarize(latencies, counters):
+    # Latency percentiles and median of the I/O counters
+    summary = {
+        'latency_ms': {
+            'min': min(latencies),
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies),
+            'mean': statistics.mean(latencies)
+        }
+    }
+
+    for counter, values in counters.items():
+        summary[counter] = statistics.median(values)
+
+    return summary
+
+def get_version():
+    # Commit of Embuche used for the benchmark, results of several versions can be compared
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except Exception as e:
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the startup cost of the packer on synthetic payloads built with Embuche.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1, 10, 100], help='Sizes of the payloads in MB (default: 1 10 100).')
+    parser.add_argument('-r', '--runs', type=int, default=20, help='Number of runs of each binary (default: 20).')
+    parser.add_argument('-o', '--output', type=str, default='startup_benchmark.json', help='JSON file of the results (default: startup_benchmark.json).')
+    parser.add_argument('-d', '--work-dir', type=str, default='/tmp/embuche_startup_benchmark', help='Directory of the payload projects (default: /tmp/embuche_startup_benchmark).')
+    parser.add_argument('--envelope', action='store_true', help='Use the envelope mode of the packer.')
+    parser.add_argument('--mode', type=str, choices=['cbc', 'ctr'], default='cbc', help='AES mode of the packer (default: cbc).')
+    parser.add_argument('--threads', type=int, default=0, help='Number of threads of the packer, 0 for the number of CPU (default: 0).')
+    parser.add_argument('--compression', type=str, nargs='+', choices=['zlib', 'lzma'], default=[], help='Benchmark the packer again with these compressions.')
+    parser.add_argument('--compressible', action='store_true', help='Use payloads with 4 bits of entropy by byte instead of random data.')
+    args = parser.parse_args()
+
+    combinations = COMBINATIONS + [{'packer': True, 'packer_embuche': False, 'compression': compression} for compression in args.compression]
+
+    packer_options = {'envelope': args.envelope, 'mode': args.mode, 'threads': args.threads}
+    results = []
+
+    print('{:>10} {:<20} {:>12} {:>10} {:>10} {:>10} {:>12} {:>8} {:>12}'.format('Size (MB)', 'Packer', 'Binary (MB)', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'Written (B)', 'Syscw', 'vs packer'))
+
+    for size in args.sizes:
+        source_code = create_project(os.path.abspath(args.work_dir), size, args.compressible)
+        log_path = os.path.join(os.path.dirname(os.path.dirname(source_code)), 'build.log')
+        packer_p50 = None
+
+        for combination in combinations:
+            start = time.time()
+            with open(log_path, 'a') as log:
+                binary = build(source_code, combination, packer_options, log)
+            build_time = time.time() - start
+
+            result = {
+                'size_mb': size,
+                'name': get_name(combination),
+                'packer': combination['packer'],
+                'packer_embuche': combination['packer_embuche'],
+                'compression': combination['compression'],
+                'packer_options': packer_options if combination['packer'] else {},
+                'binary_size': os.path.getsize(binary),
+                'build_time_s': build_time,
+                'runs': args.runs
+            }
+            result.update(summarize(*run(binary, args.runs)))
+            results.append(result)
+
+            # Change of the launch time compared to the packer without compression
+            if result['name'] == 'packer':
+                packer_p50 = result['latency_ms']['p50']
+            change = '{:+.2f} ms'.format(result['latency_ms']['p50'] - packer_p50) if combination['compression'] != 'none' and packer_p50 is not None else ''
+            result['p50_change_ms'] = result['latency_ms']['p50'] - packer_p50 if change else None
+
+            print('{:>10} {:<20} {:>12.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.0f} {:>8.0f} {:>12}'.format(size, result['name'], result['binary_size'] / (1024 * 1024), result['latency_ms']['p50'], result['latency_ms']['p90'], result['latency_ms']['p99'], result['wchar'], result['syscw'], change))
+
+    with open(args.output, 'w') as target:
+        json.dump({
+            'version': get_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+            'results': results
+        }, target, indent=4)
+
+    print('[+] Results saved to {}'.format(args.output))
@@ -0,0 +1,277 @@
+#!/usr/bin/python3.8
+# coding: utf-8
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from struct import unpack_from
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from class_embuche.daemon import load_script, SCRIPTS
+
+# Passes of elf_passes.py benchmarked (module of hellf_scripts), the passes which need a binary without section header
+# are applied on the output of remove_section_header
+TRANSFORMS = [
+    ('remove_section_header', 'remove_sections'),
+    ('flip_sections_flags', 'flip_sections_flags'),
+    ('hide_entry_point', 'hide_entry_point'),
+    ('flip_sections_flags_and_hide_entry_point', 'flip_sections_flags_and_hide_entry_point'),
+    ('mixing_symbols', 'mixing_symbols_table'),
+    ('endianness', 'endianness_changer')
+]
+WITHOUT_SECTION_HEADER = ['flip_sections_flags', 'hide_entry_point', 'flip_sections_flags_and_hide_entry_point']
+
+# Buckets of the size of the binaries (name, upper bound in bytes)
+BUCKETS = [
+    ('< 64 KB', 64 * 1024),
+    ('64 KB - 1 MB', 1024 * 1024),
+    ('1 - 16 MB', 16 * 1024 * 1024),
+    ('>= 16 MB', None)
+]
+
+ET_EXEC = 2
+ET_DYN = 3
+
+def is_elf64(path):
+    # Return True if path is a little endian ELF64 executable or shared object (the binaries Embuche builds)
+    try:
+        with open(path, 'rb') as target:
+            header = target.read(18)
+    except OSError:
+        return False
+
+    return len(header) == 18 and header[:4] == b'\x7fELF' and header[4] == 2 and header[5] == 1 and unpack_from('<H', header, 16)[0] in [ET_EXEC, ET_DYN]
+
+def find_corpus(paths, max_files, max_size, seed):
+    # Return the ELF64 binaries of paths (binaries or directories, the symbolic links in directories are skipped),
+    # a random sample of max_files of them if there're more
+    binaries = set()
+
+    for path in paths:
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [os.path.join(root, file) for root, directories, files in os.walk(path) for file in files]
+
+        for binary in candidates:
+            if binary != path and (os.path.islink(binary) or not os.path.isfile(binary)):
+                continue
+            if os.path.getsize(binary) == 0 or (max_size is not None and os.path.getsize(binary) > max_size * 1024 * 1024):
+                continue
+            if is_elf64(binary):
+                binaries.add(binary)
+
+    binaries = sorted(binaries)
+    if max_files is not None and len(binaries) > max_files:
+        binaries = sorted(random.Random(seed).sample(binaries, max_files))
+
+    return binaries
+
+def get_bucket(size):
+    # Return the name of the bucket of a binary of size bytes
+    for name, limit in BUCKETS:
+        if limit is None or size < limit:
+            return name
+
+def measure(module, name, source, output, seed):
+    # Apply the pass name on a copy of source (output) in a child forked from the benchmark, the modules are already loaded,
+    # return the wall time and CPU time of the pass (mapping, transformation and save), the peak RSS of the child and the size of output
+    shutil.copyfile(source, output)
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+
+        try:
+            # The passes print their messages
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+
+            random.seed(seed)
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            check, transformation = module.PASSES[name]
+
+            start, cpu_start = time.perf_counter(), time.process_time()
+            elf = module.elf_patcher(output)
+
+            if check is not None and not check(elf):
+                result = {'status': 'skipped'}
+            else:
+                transformation(elf).close()
+                result = {
+                    'status': 'ok',
+                    'wall_s': time.perf_counter() - start,
+                    'cpu_s': time.process_time() - cpu_start,
+                    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    'rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline,
+                    'output_size': os.path.getsize(output)
+                }
+        except BaseException as error:
+            result = {'status': 'error', 'error': repr(error)}
+
+        os.write(write_fd, json.dumps(result).encode())
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        data = pipe.read()
+    _, status = os.waitpid(pid, 0)
+
+    # The child was killed (segmentation fault, out of memory)
+    if not data:
+        return {'status': 'error', 'error': 'exit status {}'.format(status)}
+
+    return json.loads(data)
+
+def benchmark(module, binaries, work_directory, runs, seed):
+    # Apply every pass on every binary runs times, return a result for each binary and pass (median of the runs)
+    corpus_directory = os.path.join(work_directory, 'corpus')
+    output_directory = os.path.join(work_directory, 'output')
+    shutil.rmtree(output_directory, ignore_errors=True)
+    os.makedirs(corpus_directory, exist_ok=True)
+    os.makedirs(output_directory)
+
+    results = []
+
+    for index, binary in enumerate(binaries):
+        # The passes are applied on a copy of the binary, never on the original
+        source = os.path.join(corpus_directory, '{}_{}'.format(index, os.path.basename(binary)))
+        shutil.copyfile(binary, source)
+        without_section_header = os.path.join(output_directory, 'remove_section_header')
+
+        for name, script in TRANSFORMS:
+            input_file = without_section_header if name in WITHOUT_SECTION_HEADER else source
+            output = os.path.join(output_directory, name)
+
+            if not os.path.exists(input_file):
+                # remove_section_header failed on this binary
+                measures = [{'status': 'error', 'error': 'no binary without section header'}]
+            else:
+                measures = [measure(module, name, input_file, output, seed) for run in range(runs)]
+
+            result = {
+                'binary': binary,
+                'transform': name,
+                'script': script,
+                'input_size': os.path.getsize(input_file) if os.path.exists(input_file) else os.path.getsize(source),
+                'bucket': get_bucket(os.path.getsize(source)),
+                'status': measures[-1]['status']
+            }
+
+            if result['status'] == 'ok':
+                result.update({
+                    'wall_s': statistics.median(measure['wall_s'] for measure in measures),
+                    'cpu_s': statistics.median(measure['cpu_s'] for measure in measures),
+                    'max_rss_kb': max(measure['max_rss_kb'] for measure in measures),
+                    'rss_growth_kb': max(measure['rss_growth_kb'] for measure in measures),
+                    'output_size': measures[-1]['output_size']
+                })
+            elif result['status'] == 'error':
+                result['error'] = measures[-1]['error']
+
+            results.append(result)
+
+            # The output of remove_section_header is the input of the next passes
+            if name == 'remove_section_header' and result['status'] == 'ok':
+                os.replace(output, without_section_header)
+            elif os.path.exists(output):
+                os.remove(output)
+
+        if os.path.exists(without_section_header):
+            os.remove(without_section_header)
+        os.remove(source)
+
+        print('[+] {}/{} {}'.format(index + 1, len(binaries), binary), file=sys.stderr)
+
+    return results
+
+def summarize(results):
+    # Files/s, MB/s, peak RSS and growth of the output of each pass by bucket of size (and for every size)
+    summary = []
+
+    for name, script in TRANSFORMS:
+        for bucket in [name for name, limit in BUCKETS] + ['all']:
+            selected = [result for result in results if result['transform'] == name and (bucket == 'all' or result['bucket'] == bucket)]
+            done = [result for result in selected if result['status'] == 'ok']
+
+            if not selected:
+                continue
+
+            wall = sum(result['wall_s'] for result in done)
+            summary.append({
+                'transform': name,
+                'script': script,
+                'bucket': bucket,
+                'files': len(selected),
+                'skipped': len([result for result in selected if result['status'] == 'skipped']),
+                'errors': len([result for result in selected if result['status'] == 'error']),
+                'files_per_s': len(done) / wall if wall > 0 else None,
+                'mb_per_s': sum(result['input_size'] for result in done) / (1024 * 1024) / wall if wall > 0 else None,
+                'max_rss_kb': max([result['max_rss_kb'] for result in done], default=None),
+                'max_rss_growth_kb': max([result['rss_growth_kb'] for result in done], default=None),
+                'growth_percent': statistics.mean((result['output_size'] - result['input_size']) * 100 / result['input_size'] for result in done) if done else None
+            })
+
+    return summary
+
+def get_version():
+    # Commit of Embuche used for the benchmark, results of several versions can be compared
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except Exception as e:
+        return None
+
+def format_number(value, format):
+    # Format a value of the summary, - if there's no value (every file skipped)
+    return format.format(value) if value is not None else '-'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the throughput of the file format hacks (hellf_scripts) on a corpus of ELF64 binaries.')
+    parser.add_argument('paths', type=str, nargs='*', default=['/usr/bin', '/usr/lib'], help='Directories (or binaries) of the corpus, the binaries are copied before being modified (default: /usr/bin /usr/lib).')
+    parser.add_argument('-n', '--max-files', type=int, default=200, help='Maximum number of binaries, a random sample is taken if there\'re more (default: 200).')
+    parser.add_argument('--max-size', type=int, default=None, help='Skip the binaries bigger than this size in MB.')
+    parser.add_argument('-r', '--runs', type=int, default=1, help='Number of runs of each pass on each binary, the median is kept (default: 1).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the sample of the corpus and of the random parts of the passes (default: 0).')
+    parser.add_argument('-o', '--output', type=str, default='transform_benchmark.json', help='JSON file of the results (default: transform_benchmark.json).')
+    parser.add_argument('-d', '--work-dir', type=str, default='/tmp/embuche_transform_benchmark', help='Directory of the copies of the binaries (default: /tmp/embuche_transform_benchmark).')
+    args = parser.parse_args()
+
+    # elf_passes.py and the Hellf passes are imported once, each pass is applied in a child forked from this process
+    module = load_script(SCRIPTS['elf_passes.py'])
+
+    binaries = find_corpus(args.paths, args.max_files, args.max_size, args.seed)
+
+    if len(binaries) == 0:
+        print('[-] No ELF64 binary in {}.'.format(' '.join(args.paths)))
+        exit(1)
+
+    print('[+] {} binaries, {:.2f} MB'.format(len(binaries), sum(os.path.getsize(binary) for binary in binaries) / (1024 * 1024)))
+
+    results = benchmark(module, binaries, os.path.abspath(args.work_dir), args.runs, args.seed)
+    summary = summarize(results)
+
+    print('{:<42} {:<14} {:>6} {:>8} {:>7} {:>9} {:>9} {:>14} {:>10}'.format('Transform', 'Size', 'Files', 'Skipped', 'Errors', 'Files/s', 'MB/s', 'Peak RSS (KB)', 'Growth'))
+    for line in summary:
+        print('{:<42} {:<14} {:>6} {:>8} {:>7} {:>9} {:>9} {:>14} {:>10}'.format(line['transform'], line['bucket'], line['files'], line['skipped'], line['errors'],
+              format_number(line['files_per_s'], '{:.1f}'), format_number(line['mb_per_s'], '{:.1f}'), format_number(line['max_rss_kb'], '{}'), format_number(line['growth_percent'], '{:+.2f}%')))
+
+    with open(args.output, 'w') as target:
+        json.dump({
+            'version': get_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+            'corpus': {'paths': args.paths, 'binaries': len(binaries), 'seed': args.seed, 'runs': args.runs},
+            'summary': summary,
+            'results': results
+        }, target, indent=4)
+
+    print('[+] Results saved to {}'.format(args.output))